@@ -0,0 +1,34 @@
+"""product listing indexes
+
+Revision ID: a1c3e5f7b901
+Revises: 0fff542c6c9d
+Create Date: 2026-10-18 10:12:31.402117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a1c3e5f7b901'
+down_revision: Union[str, Sequence[str], None] = '0fff542c6c9d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_product_price_id', 'product', ['price', 'id'], unique=False)
+    op.create_index('ix_product_created_at_id', 'product', ['created_at', 'id'], unique=False)
+    op.create_index('ix_product_name_id', 'product', ['name', 'id'], unique=False)
+    op.create_index('ix_product_category_id_id', 'product', ['category_id', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_product_category_id_id', table_name='product')
+    op.drop_index('ix_product_name_id', table_name='product')
+    op.drop_index('ix_product_created_at_id', table_name='product')
+    op.drop_index('ix_product_price_id', table_name='product')
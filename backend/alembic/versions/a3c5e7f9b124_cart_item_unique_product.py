@@ -0,0 +1,46 @@
+"""cart item unique product
+
+Revision ID: a3c5e7f9b124
+Revises: f2b4d6e8a013
+Create Date: 2026-10-18 23:48:31.274069
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a3c5e7f9b124'
+down_revision: Union[str, Sequence[str], None] = 'f2b4d6e8a013'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute(
+        """
+        WITH ranked AS (
+            SELECT id, min(id) OVER (PARTITION BY cart_id, product_id) AS keep_id
+            FROM cart_item
+        ),
+        removed AS (
+            DELETE FROM cart_item USING ranked
+            WHERE cart_item.id = ranked.id AND ranked.id <> ranked.keep_id
+            RETURNING ranked.keep_id, cart_item.quantity
+        )
+        UPDATE cart_item SET quantity = cart_item.quantity + merged.quantity
+        FROM (
+            SELECT keep_id, SUM(quantity) AS quantity FROM removed GROUP BY keep_id
+        ) merged
+        WHERE cart_item.id = merged.keep_id
+        """
+    )
+    op.create_unique_constraint(None, 'cart_item', ['cart_id', 'product_id'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_constraint('cart_item_cart_id_product_id_key', 'cart_item', type_='unique')
@@ -0,0 +1,38 @@
+"""product image renditions
+
+Revision ID: a7c9e1f3b563
+Revises: f6b8d0e2a451
+Create Date: 2026-10-18 18:11:05.214836
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a7c9e1f3b563'
+down_revision: Union[str, Sequence[str], None] = 'f6b8d0e2a451'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('product_image', sa.Column('content_hash', sa.String(length=64), nullable=True))
+    op.add_column('product_image', sa.Column('thumbnail_url', sa.String(), nullable=True))
+    op.add_column('product_image', sa.Column('webp_url', sa.String(), nullable=True))
+    op.drop_constraint(op.f('product_image_url_key'), 'product_image', type_='unique')
+    op.create_index(op.f('ix_product_image_content_hash'), 'product_image', ['content_hash'], unique=False)
+    op.create_unique_constraint(None, 'product_image', ['product_id', 'content_hash'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_constraint('product_image_product_id_content_hash_key', 'product_image', type_='unique')
+    op.drop_index(op.f('ix_product_image_content_hash'), table_name='product_image')
+    op.create_unique_constraint(op.f('product_image_url_key'), 'product_image', ['url'], postgresql_nulls_not_distinct=False)
+    op.drop_column('product_image', 'webp_url')
+    op.drop_column('product_image', 'thumbnail_url')
+    op.drop_column('product_image', 'content_hash')
@@ -0,0 +1,38 @@
+"""guest carts
+
+Revision ID: b4d6f8a0c235
+Revises: a3c5e7f9b124
+Create Date: 2026-10-19 00:21:47.508112
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b4d6f8a0c235'
+down_revision: Union[str, Sequence[str], None] = 'a3c5e7f9b124'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('cart', sa.Column('expires_at', sa.DateTime(), nullable=True))
+    op.alter_column('cart', 'user_id',
+               existing_type=sa.INTEGER(),
+               nullable=True)
+    op.create_index('ix_cart_guest_expires_at', 'cart', ['expires_at'], unique=False, postgresql_where=sa.text('user_id IS NULL'))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_cart_guest_expires_at', table_name='cart', postgresql_where=sa.text('user_id IS NULL'))
+    op.execute("DELETE FROM cart_item USING cart WHERE cart_item.cart_id = cart.id AND cart.user_id IS NULL")
+    op.execute("DELETE FROM cart WHERE user_id IS NULL")
+    op.alter_column('cart', 'user_id',
+               existing_type=sa.INTEGER(),
+               nullable=False)
+    op.drop_column('cart', 'expires_at')
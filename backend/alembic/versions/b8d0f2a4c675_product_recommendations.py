@@ -0,0 +1,58 @@
+"""product recommendations
+
+Revision ID: b8d0f2a4c675
+Revises: a7c9e1f3b563
+Create Date: 2026-10-18 19:03:27.518204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b8d0f2a4c675'
+down_revision: Union[str, Sequence[str], None] = 'a7c9e1f3b563'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('product_cooccurrence',
+    sa.Column('product_id', sa.Integer(), nullable=False),
+    sa.Column('related_product_id', sa.Integer(), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['product_id'], ['product.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['related_product_id'], ['product.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('product_id', 'related_product_id')
+    )
+    op.create_table('related_product',
+    sa.Column('product_id', sa.Integer(), nullable=False),
+    sa.Column('related_product_id', sa.Integer(), nullable=False),
+    sa.Column('score', sa.Integer(), nullable=False),
+    sa.Column('rank', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['product_id'], ['product.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['related_product_id'], ['product.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('product_id', 'related_product_id')
+    )
+    op.create_index('ix_related_product_product_id_rank', 'related_product', ['product_id', 'rank'], unique=False)
+    op.create_table('recommendation_processed_order',
+    sa.Column('order_id', sa.Integer(), nullable=False),
+    sa.Column('processed_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+    sa.ForeignKeyConstraint(['order_id'], ['order.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('order_id')
+    )
+    op.create_index('ix_order_updated_at', 'order', ['updated_at'], unique=False)
+    op.create_index('ix_order_item_order_id', 'order_item', ['order_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_order_item_order_id', table_name='order_item')
+    op.drop_index('ix_order_updated_at', table_name='order')
+    op.drop_table('recommendation_processed_order')
+    op.drop_index('ix_related_product_product_id_rank', table_name='related_product')
+    op.drop_table('related_product')
+    op.drop_table('product_cooccurrence')
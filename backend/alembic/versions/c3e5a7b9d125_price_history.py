@@ -0,0 +1,74 @@
+"""price history
+
+Revision ID: c3e5a7b9d125
+Revises: b2d4f6a8c013
+Create Date: 2026-10-18 12:41:09.553871
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c3e5a7b9d125'
+down_revision: Union[str, Sequence[str], None] = 'b2d4f6a8c013'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('price_history',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('product_id', sa.Integer(), nullable=False),
+    sa.Column('price', sa.Numeric(precision=10, scale=2), nullable=False),
+    sa.Column('source', sa.Enum('base', 'discount', name='pricesource'), nullable=False),
+    sa.Column('recorded_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+    sa.ForeignKeyConstraint(['product_id'], ['product.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_price_history_product_id_recorded_at', 'price_history', ['product_id', 'recorded_at'], unique=False)
+    op.add_column('product', sa.Column('lowest_price_30_days', sa.Numeric(precision=10, scale=2), nullable=True))
+
+    op.execute("""
+        INSERT INTO price_history (product_id, price, source, recorded_at)
+        SELECT id, price, 'base', created_at FROM product
+        UNION ALL
+        SELECT product_id, new_price, 'discount', valid_from FROM discount
+        UNION ALL
+        SELECT discount.product_id, product.price, 'base', discount.valid_until
+        FROM discount JOIN product ON product.id = discount.product_id
+        WHERE discount.valid_until IS NOT NULL
+    """)
+    op.execute("""
+        UPDATE product SET lowest_price_30_days = prices.lowest_price
+        FROM (
+            SELECT product_id, MIN(price) AS lowest_price FROM (
+                (
+                    SELECT product_id, price FROM price_history
+                    WHERE recorded_at > now() - interval '30 days'
+                      AND recorded_at <= now()
+                )
+                UNION ALL
+                (
+                    SELECT DISTINCT ON (product_id) product_id, price
+                    FROM price_history
+                    WHERE recorded_at <= now() - interval '30 days'
+                    ORDER BY product_id, recorded_at DESC, id DESC
+                )
+            ) window_prices
+            GROUP BY product_id
+        ) prices
+        WHERE product.id = prices.product_id
+    """)
+    op.execute("UPDATE product SET lowest_price_30_days = price WHERE lowest_price_30_days IS NULL")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('product', 'lowest_price_30_days')
+    op.drop_index('ix_price_history_product_id_recorded_at', table_name='price_history')
+    op.drop_table('price_history')
+    op.execute("DROP TYPE IF EXISTS pricesource")
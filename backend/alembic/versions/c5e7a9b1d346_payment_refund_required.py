@@ -0,0 +1,33 @@
+"""payment refund required
+
+Revision ID: c5e7a9b1d346
+Revises: b4d6f8a0c235
+Create Date: 2026-10-19 09:14:02.731845
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c5e7a9b1d346'
+down_revision: Union[str, Sequence[str], None] = 'b4d6f8a0c235'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute("ALTER TYPE status ADD VALUE IF NOT EXISTS 'refund_required'")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("UPDATE payment SET status = 'failed' WHERE status = 'refund_required'")
+    op.execute("ALTER TYPE status RENAME TO status_old")
+    op.execute("CREATE TYPE status AS ENUM ('pending', 'success', 'failed')")
+    op.execute("ALTER TABLE payment ALTER COLUMN status TYPE status USING status::text::status")
+    op.execute("ALTER TABLE shipment ALTER COLUMN status TYPE status USING status::text::status")
+    op.execute("DROP TYPE status_old")
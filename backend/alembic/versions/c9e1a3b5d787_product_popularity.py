@@ -0,0 +1,37 @@
+"""product popularity
+
+Revision ID: c9e1a3b5d787
+Revises: b8d0f2a4c675
+Create Date: 2026-10-18 19:41:52.083316
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c9e1a3b5d787'
+down_revision: Union[str, Sequence[str], None] = 'b8d0f2a4c675'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('product_popularity',
+    sa.Column('product_id', sa.Integer(), nullable=False),
+    sa.Column('score', sa.Float(), nullable=False),
+    sa.Column('trend_key', sa.Float(), nullable=False),
+    sa.Column('scored_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+    sa.ForeignKeyConstraint(['product_id'], ['product.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('product_id')
+    )
+    op.create_index('ix_product_popularity_trend_key', 'product_popularity', ['trend_key'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_product_popularity_trend_key', table_name='product_popularity')
+    op.drop_table('product_popularity')
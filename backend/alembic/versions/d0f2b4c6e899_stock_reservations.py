@@ -0,0 +1,65 @@
+"""stock reservations
+
+Revision ID: d0f2b4c6e899
+Revises: c9e1a3b5d787
+Create Date: 2026-10-18 21:07:19.552840
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd0f2b4c6e899'
+down_revision: Union[str, Sequence[str], None] = 'c9e1a3b5d787'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('product', sa.Column('reserved', sa.Integer(), server_default='0', nullable=False))
+    op.create_table('stock_reservation',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('product_id', sa.Integer(), nullable=False),
+    sa.Column('order_id', sa.Integer(), nullable=False),
+    sa.Column('quantity', sa.Integer(), nullable=False),
+    sa.Column('expires_at', sa.DateTime(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+    sa.ForeignKeyConstraint(['order_id'], ['order.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['product_id'], ['product.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_stock_reservation_expires_at', 'stock_reservation', ['expires_at'], unique=False)
+    op.create_index('ix_stock_reservation_order_id', 'stock_reservation', ['order_id'], unique=False)
+    op.execute(
+        """
+        INSERT INTO stock_reservation (product_id, order_id, quantity, expires_at)
+        SELECT order_item.product_id, order_item.order_id, SUM(order_item.quantity),
+               now() + interval '15 minutes'
+        FROM order_item JOIN "order" ON "order".id = order_item.order_id
+        WHERE "order".status = 'pending' AND order_item.product_id IS NOT NULL
+        GROUP BY order_item.product_id, order_item.order_id
+        """
+    )
+    op.execute(
+        """
+        UPDATE product SET stock = product.stock + held.quantity, reserved = held.quantity
+        FROM (
+            SELECT product_id, SUM(quantity) AS quantity
+            FROM stock_reservation GROUP BY product_id
+        ) held
+        WHERE product.id = held.product_id
+        """
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("UPDATE product SET stock = stock - reserved WHERE reserved > 0")
+    op.drop_index('ix_stock_reservation_order_id', table_name='stock_reservation')
+    op.drop_index('ix_stock_reservation_expires_at', table_name='stock_reservation')
+    op.drop_table('stock_reservation')
+    op.drop_column('product', 'reserved')
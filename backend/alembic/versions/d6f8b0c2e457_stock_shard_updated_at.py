@@ -0,0 +1,28 @@
+"""stock shard updated at
+
+Revision ID: d6f8b0c2e457
+Revises: c5e7a9b1d346
+Create Date: 2026-10-19 10:02:37.410588
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd6f8b0c2e457'
+down_revision: Union[str, Sequence[str], None] = 'c5e7a9b1d346'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('product_stock_shard', sa.Column('updated_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('product_stock_shard', 'updated_at')
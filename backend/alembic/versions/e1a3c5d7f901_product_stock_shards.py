@@ -0,0 +1,49 @@
+"""product stock shards
+
+Revision ID: e1a3c5d7f901
+Revises: d0f2b4c6e899
+Create Date: 2026-10-18 22:16:04.318527
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e1a3c5d7f901'
+down_revision: Union[str, Sequence[str], None] = 'd0f2b4c6e899'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('product', sa.Column('stock_shards', sa.Integer(), server_default='0', nullable=False))
+    op.create_table('product_stock_shard',
+    sa.Column('product_id', sa.Integer(), nullable=False),
+    sa.Column('shard', sa.Integer(), nullable=False),
+    sa.Column('allocated', sa.Integer(), nullable=False),
+    sa.Column('reserved', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['product_id'], ['product.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('product_id', 'shard')
+    )
+    op.add_column('stock_reservation', sa.Column('shard', sa.Integer(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute(
+        """
+        UPDATE product SET reserved = shards.reserved
+        FROM (
+            SELECT product_id, SUM(reserved) AS reserved
+            FROM product_stock_shard GROUP BY product_id
+        ) shards
+        WHERE product.id = shards.product_id
+        """
+    )
+    op.drop_column('stock_reservation', 'shard')
+    op.drop_table('product_stock_shard')
+    op.drop_column('product', 'stock_shards')
@@ -0,0 +1,40 @@
+"""category path
+
+Revision ID: e5a7c9d1f349
+Revises: d4f6b8c0e237
+Create Date: 2026-10-18 15:34:18.209954
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5a7c9d1f349'
+down_revision: Union[str, Sequence[str], None] = 'd4f6b8c0e237'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('category', sa.Column('path', sa.String(), nullable=True))
+    op.create_index('ix_category_path', 'category', ['path'], unique=False, postgresql_ops={'path': 'text_pattern_ops'})
+    op.execute("""
+        WITH RECURSIVE tree AS (
+            SELECT id, CAST(id AS TEXT) || '/' AS path
+            FROM category WHERE parent_id IS NULL
+            UNION ALL
+            SELECT category.id, tree.path || category.id || '/'
+            FROM category JOIN tree ON category.parent_id = tree.id
+        )
+        UPDATE category SET path = tree.path FROM tree WHERE category.id = tree.id
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_category_path', table_name='category', postgresql_ops={'path': 'text_pattern_ops'})
+    op.drop_column('category', 'path')
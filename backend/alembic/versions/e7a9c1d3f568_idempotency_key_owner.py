@@ -0,0 +1,52 @@
+"""idempotency key owner
+
+Revision ID: e7a9c1d3f568
+Revises: d6f8b0c2e457
+Create Date: 2026-10-19 10:41:19.826304
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e7a9c1d3f568'
+down_revision: Union[str, Sequence[str], None] = 'd6f8b0c2e457'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('idempotency_key', sa.Column('owner', sa.String(length=255), server_default='', nullable=False))
+    op.execute(
+        """
+        UPDATE idempotency_key SET owner = COALESCE(
+            'user:' || "order".user_id,
+            'guest:' || lower("order".contact_email),
+            ''
+        )
+        FROM "order"
+        WHERE "order".id = idempotency_key.order_id
+        """
+    )
+    op.alter_column('idempotency_key', 'owner', server_default=None)
+    op.drop_constraint('idempotency_key_scope_key_key', 'idempotency_key', type_='unique')
+    op.create_unique_constraint(None, 'idempotency_key', ['scope', 'owner', 'key'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute(
+        """
+        DELETE FROM idempotency_key WHERE id NOT IN (
+            SELECT DISTINCT ON (scope, key) id FROM idempotency_key
+            ORDER BY scope, key, created_at DESC
+        )
+        """
+    )
+    op.drop_constraint('idempotency_key_scope_owner_key_key', 'idempotency_key', type_='unique')
+    op.create_unique_constraint(None, 'idempotency_key', ['scope', 'key'])
+    op.drop_column('idempotency_key', 'owner')
@@ -0,0 +1,28 @@
+"""category updated_at
+
+Revision ID: f6b8d0e2a451
+Revises: e5a7c9d1f349
+Create Date: 2026-10-18 17:02:44.731590
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f6b8d0e2a451'
+down_revision: Union[str, Sequence[str], None] = 'e5a7c9d1f349'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('category', sa.Column('updated_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('category', 'updated_at')
@@ -0,0 +1,159 @@
+"""Checkout throughput on a single hot product.
+
+Runs concurrent guest checkouts against one product and reports checkouts
+per second. The "locked" mode takes the product row lock at the start of
+the transaction, the way checkout did before stock was claimed with a single
+conditional UPDATE. The "claim" mode runs the current checkout as is.
+--shards N additionally runs the claim mode with the product's stock split
+across N counter rows.
+
+--latency-ms adds a delay before every statement and commit to stand in for the
+network round trip between the app and the database; with a local socket
+the row lock is released too quickly for the difference to show.
+
+Needs a disposable Postgres database in DATABASE_URL; created orders are
+deleted and the product's stock is restored afterwards.
+
+    python -m benchmarks.checkout_hot_sku --buyers 100 --orders 5
+"""
+import argparse
+import os
+import threading
+import time
+from fastapi import BackgroundTasks
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import sessionmaker
+from src.database import DATABASE_URL
+from src.shopping.schemas import GuestOrder
+from src.shopping.service import create_guest_order
+from src.products.stock_shards import set_stock_shards
+
+SHIPPING = {
+    "courier": "dhl",
+    "delivery_type": "courier",
+    "shipping_full_name": "Benchmark",
+    "shipping_street": "Street 1",
+    "shipping_city": "City",
+    "shipping_postal_code": "00-000",
+    "shipping_country": "PL",
+    "shipping_phone": "000000000",
+}
+
+
+def buyer(Session, mode, product_id, orders, order_ids, failures):
+    db = Session()
+    data = GuestOrder(
+        email="benchmark@example.com",
+        items=[{"product_id": product_id, "quantity": 1}],
+        shipping_data=SHIPPING,
+    )
+    try:
+        for _ in range(orders):
+            if mode == "locked":
+                db.execute(
+                    text("SELECT id FROM product WHERE id = :id FOR UPDATE"),
+                    {"id": product_id},
+                )
+            order = create_guest_order(db, data, BackgroundTasks())
+            if order:
+                order_ids.append(order.id)
+            else:
+                failures.append(product_id)
+    finally:
+        db.close()
+
+
+def run(Session, mode, product_id, buyers, orders):
+    order_ids = []
+    failures = []
+    threads = [
+        threading.Thread(
+            target=buyer,
+            args=(Session, mode, product_id, orders, order_ids, failures),
+        )
+        for _ in range(buyers)
+    ]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    return order_ids, failures, elapsed
+
+
+def cleanup(engine, order_ids):
+    with engine.begin() as connection:
+        for table, column in (("shipment", "order_id"), ("order_item", "order_id")):
+            connection.execute(
+                text(f"DELETE FROM {table} WHERE {column} = ANY(:ids)"),
+                {"ids": order_ids},
+            )
+        connection.execute(
+            text('DELETE FROM "order" WHERE id = ANY(:ids)'), {"ids": order_ids}
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--product-id", type=int, default=1)
+    parser.add_argument("--buyers", type=int, default=100)
+    parser.add_argument("--orders", type=int, default=5)
+    parser.add_argument("--mode", choices=["locked", "claim", "both"], default="both")
+    parser.add_argument("--latency-ms", type=float, default=1.0)
+    parser.add_argument("--shards", type=int, default=0)
+    args = parser.parse_args()
+
+    engine = create_engine(
+        os.getenv("BENCHMARK_DATABASE_URL", DATABASE_URL),
+        pool_size=args.buyers,
+        max_overflow=0,
+    )
+    if args.latency_ms:
+        for name in ("before_cursor_execute", "commit"):
+            event.listen(engine, name, lambda *_: time.sleep(args.latency_ms / 1000))
+    Session = sessionmaker(bind=engine, autocommit=False, autoflush=False)
+
+    with engine.begin() as connection:
+        stock, reserved = connection.execute(
+            text("SELECT stock, reserved FROM product WHERE id = :id"),
+            {"id": args.product_id},
+        ).one()
+    total = args.buyers * args.orders
+
+    modes = ["locked", "claim"] if args.mode == "both" else [args.mode]
+    runs = [(mode, 0) for mode in modes]
+    if args.shards:
+        runs.append(("claim", args.shards))
+    for mode, shards in runs:
+        with engine.begin() as connection:
+            connection.execute(
+                text("UPDATE product SET stock = :stock, reserved = 0 WHERE id = :id"),
+                {"stock": total * 2, "id": args.product_id},
+            )
+        db = Session()
+        set_stock_shards(db, args.product_id, shards)
+        db.close()
+        order_ids, failures, elapsed = run(
+            Session, mode, args.product_id, args.buyers, args.orders
+        )
+        cleanup(engine, order_ids)
+        label = f"{mode} x{shards}" if shards else mode
+        print(
+            f"{label:>10}: {len(order_ids)} checkouts, {len(failures)} failed, "
+            f"{elapsed:.2f}s, {len(order_ids) / elapsed:.1f} checkouts/s"
+        )
+
+    db = Session()
+    set_stock_shards(db, args.product_id, 0)
+    db.close()
+
+    with engine.begin() as connection:
+        connection.execute(
+            text("UPDATE product SET stock = :stock, reserved = :reserved WHERE id = :id"),
+            {"stock": stock, "reserved": reserved, "id": args.product_id},
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,20 @@
 from fastapi import APIRouter, Depends
 from sqlalchemy.orm import Session
-from src.dependencies import get_db
+from src.dependencies import get_read_db
 from src.users.models import User
 from src.constants import admin_required
 from src.admin import service, schemas
+from typing import List
 
 router = APIRouter(prefix="/admin/stats", tags=["admin-stats"])
 
 @router.get("/dashboard", response_model=schemas.DashboardStats)
 def get_dashboard(
-    db: Session = Depends(get_db), 
+    db: Session = Depends(get_read_db), 
     current_user: User = Depends(admin_required)
 ):
-    return service.get_admin_dashboard_stats(db)
\ No newline at end of file
+    return service.get_admin_dashboard_stats(db)
+
+@router.get("/cache", response_model=List[schemas.CacheStats])
+def get_cache_stats(current_user: User = Depends(admin_required)):
+    return service.get_cache_stats()
\ No newline at end of file
@@ -21,4 +21,13 @@ class DashboardStats(BaseModel):
     average_order_value: float
     revenue_chart: List[RevenuePoint]
     top_profitable_products: List[ProductProfitStat]
-    product_conversions: List[ProductConversionStat]
\ No newline at end of file
+    product_conversions: List[ProductConversionStat]
+
+class CacheStats(BaseModel):
+    name: str
+    size: int
+    maxsize: int
+    ttl: float
+    hits: int
+    misses: int
+    hit_rate: float
\ No newline at end of file
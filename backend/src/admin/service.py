@@ -3,6 +3,7 @@ from sqlalchemy import func, desc, cast, Date
 from src.shopping.models import Order, OrderItem
 from src.products.models import Product
 from src.shopping.constants import OrderStatus
+from src.cache import caches
 
 def get_admin_dashboard_stats(db: Session):
     stats = db.query(
@@ -68,4 +69,7 @@ def get_admin_dashboard_stats(db: Session):
         "revenue_chart": revenue_chart,
         "top_profitable_products": top_products,
         "product_conversions": conversions
-    }
\ No newline at end of file
+    }
+
+def get_cache_stats():
+    return [cache.stats() for cache in caches]
\ No newline at end of file
@@ -7,10 +7,22 @@ from dotenv import load_dotenv
 load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL")
+REPLICA_DATABASE_URL = os.getenv("REPLICA_DATABASE_URL")
 
 engine = create_engine(DATABASE_URL)
 
+if REPLICA_DATABASE_URL:
+    replica_engine = create_engine(
+        REPLICA_DATABASE_URL,
+        connect_args={"options": "-c default_transaction_read_only=on"},
+    )
+else:
+    replica_engine = engine
+
 SessionLocal = sessionmaker(bind=engine, autocommit=False, autoflush=False)
+ReplicaSessionLocal = sessionmaker(
+    bind=replica_engine, autocommit=False, autoflush=False
+)
 
 
 class Base(DeclarativeBase):
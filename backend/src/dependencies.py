@@ -1,6 +1,7 @@
 from sqlalchemy.orm import Session
-from fastapi import Depends
-from .database import SessionLocal
+from fastapi import Depends, Request
+from .database import SessionLocal, ReplicaSessionLocal, REPLICA_DATABASE_URL
+from .replication import LSN_COOKIE, replica_has_replayed
 from typing import Generator
 
 
@@ -10,3 +11,15 @@ def get_db() -> Generator[Session, None, None]:
         yield db
     finally:
         db.close()
+
+
+def get_read_db(request: Request) -> Generator[Session, None, None]:
+    db = ReplicaSessionLocal()
+    try:
+        lsn = request.cookies.get(LSN_COOKIE)
+        if REPLICA_DATABASE_URL and lsn and not replica_has_replayed(db, lsn):
+            db.close()
+            db = SessionLocal()
+        yield db
+    finally:
+        db.close()
@@ -6,6 +6,7 @@ import random
 import smtplib
 from email.message import EmailMessage
 from src.shopping.models import Order
+from concurrent.futures import ThreadPoolExecutor, wait
 import os
 from dotenv import load_dotenv
 import random
@@ -17,10 +18,29 @@ SMTP_SERVER = os.getenv("SMTP_SERVER")
 SMTP_PORT = os.getenv("SMTP_PORT")
 SMTP_USER = os.getenv("SMTP_USER")
 SMTP_PASS = os.getenv("SMTP_PASS")
+EMAIL_WORKERS = int(os.getenv("EMAIL_WORKERS", "2"))
+EMAIL_SHUTDOWN_TIMEOUT = int(os.getenv("EMAIL_SHUTDOWN_TIMEOUT", "30"))
 
 
 logger = logging.getLogger(__name__)
 
+email_pool = ThreadPoolExecutor(max_workers=EMAIL_WORKERS)
+queued_emails = set()
+
+def queue_email(send, *args):
+    future = email_pool.submit(send, *args)
+    queued_emails.add(future)
+    future.add_done_callback(queued_emails.discard)
+    return future
+
+def shutdown_email_pool(timeout: int = EMAIL_SHUTDOWN_TIMEOUT):
+    # The orders behind queued emails are already committed, so drain the
+    # queue instead of dropping it, but never hold up shutdown forever.
+    _, pending = wait(list(queued_emails), timeout=timeout)
+    if pending:
+        logger.error(f"Dropping {len(pending)} queued emails on shutdown")
+    email_pool.shutdown(wait=False, cancel_futures=True)
+
 def send_email(subject: str, receiver: str, content: str):
     msg = EmailMessage()
     msg["Subject"] = subject
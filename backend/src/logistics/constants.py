@@ -15,6 +15,7 @@ class Status(Enum):
     pending = "pending"
     success = "success"
     failed = "failed"
+    refund_required = "refund_required"
 
 
 class Courier(Enum):
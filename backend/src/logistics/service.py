@@ -11,9 +11,17 @@ from src.logistics.constants import (
     Courier,
     CourierPrice,
 )
-from src.shopping.constants import OrderStatus
-from datetime import datetime
+from src.shopping.constants import OrderStatus, CHECKOUT_SESSION_TTL_MINUTES
+from src.shopping.reservations import (
+    extend_reservations,
+    commit_reservations,
+    release_reservations,
+    has_reservations,
+    reclaim_stock,
+)
+from datetime import datetime, timedelta
 from src.logistics.stripe import create_checkout_session
+from src.products.popularity import record_sales_popularity
 import os
 from dotenv import load_dotenv
 import logging
@@ -28,13 +36,18 @@ load_dotenv()
 def initiate_payment(db: Session, payment_data: PaymentCreate, user_id: int):
     order = (
         db.query(Order)
-        .filter(Order.id == payment_data.order_id, Order.user_id == user_id)
+        .filter(
+            Order.id == payment_data.order_id,
+            Order.user_id == user_id,
+            Order.status == OrderStatus.pending,
+        )
         .first()
     )
     if not order:
         return None, None
 
-    url, stripe_session_id = create_checkout_session(db, order)
+    expires_at = datetime.now() + timedelta(minutes=CHECKOUT_SESSION_TTL_MINUTES)
+    url, stripe_session_id = create_checkout_session(db, order, expires_at)
     if isinstance(url, dict):
         return None, None
 
@@ -50,25 +63,56 @@ def initiate_payment(db: Session, payment_data: PaymentCreate, user_id: int):
         provider=Providers.stripe,
     )
     db.add(db_payment)
+    extend_reservations(db, order.id, expires_at)
     db.commit()
     db.refresh(db_payment)
 
     return db_payment, url
 
 
-def payment_succeed(db: Session, provider_payment_id: str):
+def lock_payment_order(db: Session, provider_payment_id: str):
     db_payment = (
         db.query(Payment)
         .filter(Payment.provider_payment_id == provider_payment_id)
         .first()
     )
-    assigned_order = db.query(Order).filter(Order.id == db_payment.order_id).first()
+    if not db_payment:
+        return None, None
+
+    assigned_order = (
+        db.query(Order)
+        .filter(Order.id == db_payment.order_id)
+        .with_for_update()
+        .first()
+    )
+    db.refresh(db_payment)
+    return db_payment, assigned_order
 
+
+def payment_succeed(db: Session, provider_payment_id: str):
+    db_payment, assigned_order = lock_payment_order(db, provider_payment_id)
     if not (db_payment and assigned_order):
         return None
+    if db_payment.status in (Status.success, Status.refund_required):
+        db.rollback()
+        return db_payment
 
-    db_payment.status = Status.success
-    assigned_order.status = OrderStatus.paid
+    reserved = assigned_order.status == OrderStatus.pending and has_reservations(
+        db, assigned_order.id
+    )
+    if reserved or (
+        assigned_order.status in (OrderStatus.pending, OrderStatus.cancelled)
+        and reclaim_stock(db, assigned_order.id)
+    ):
+        db_payment.status = Status.success
+        assigned_order.status = OrderStatus.paid
+        commit_reservations(db, assigned_order.id)
+        record_sales_popularity(db, assigned_order.id)
+    else:
+        logger.error(
+            f"Payment {db_payment.id} for order {assigned_order.id} needs a refund"
+        )
+        db_payment.status = Status.refund_required
 
     db.commit()
     db.refresh(db_payment)
@@ -76,18 +120,26 @@ def payment_succeed(db: Session, provider_payment_id: str):
 
 
 def payment_failed(db: Session, provider_payment_id: str):
-    db_payment = (
-        db.query(Payment)
-        .filter(Payment.provider_payment_id == provider_payment_id)
-        .first()
-    )
-    assigned_order = db.query(Order).filter(Order.id == db_payment.order_id).first()
-
+    db_payment, assigned_order = lock_payment_order(db, provider_payment_id)
     if not (db_payment and assigned_order):
         return None
+    if db_payment.status != Status.pending:
+        db.rollback()
+        return db_payment
 
     db_payment.status = Status.failed
-    assigned_order.status = OrderStatus.cancelled
+    other_pending = (
+        db.query(Payment)
+        .filter(
+            Payment.order_id == assigned_order.id,
+            Payment.id != db_payment.id,
+            Payment.status == Status.pending,
+        )
+        .first()
+    )
+    if assigned_order.status == OrderStatus.pending and not other_pending:
+        release_reservations(db, [assigned_order.id])
+        assigned_order.status = OrderStatus.cancelled
 
     db.commit()
     db.refresh(db_payment)
@@ -194,15 +246,19 @@ def handle_webhook_event(db: Session, webhook_data: WebhookCreate, background_ta
 
     if db_event.event_type == "checkout.session.completed":
         order_id = payment_intent_id = db_event.payload["data"]["object"]["client_reference_id"]
-        order = db.query(Order).filter(Order.id == order_id).first()
-    
-        try:
-            email = order.shipment.shipping_email
-            background_tasks.add_task(send_payment_success_email, order_id, email)
-        except Exception as e:
-            logging.error(f"error in payment: {e}")
-      
         payment_intent_id = db_event.payload["data"]["object"]["id"]
-        payment_succeed(db, payment_intent_id)
+        db_payment = payment_succeed(db, payment_intent_id)
+
+        if db_payment and db_payment.status == Status.success:
+            order = db.query(Order).filter(Order.id == order_id).first()
+            try:
+                email = order.shipment.shipping_email
+                background_tasks.add_task(send_payment_success_email, order_id, email)
+            except Exception as e:
+                logging.error(f"error in payment: {e}")
+
+        mark_webhook_as_processed(db, db_event.event_id)
+    elif db_event.event_type == "checkout.session.expired":
+        payment_failed(db, db_event.payload["data"]["object"]["id"])
         mark_webhook_as_processed(db, db_event.event_id)
     return db_event
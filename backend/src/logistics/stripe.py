@@ -4,12 +4,13 @@ from dotenv import load_dotenv
 from src.shopping.models import Order, OrderItem
 from src.products.models import Product
 from sqlalchemy.orm import Session, joinedload
+from datetime import datetime
 
 load_dotenv()
 stripe.api_key = os.getenv("sk_stripe")
 
 
-def create_checkout_session(db: Session, order: Order):
+def create_checkout_session(db: Session, order: Order, expires_at: datetime):
     try:
         data = (
             db.query(Order)
@@ -37,6 +38,7 @@ def create_checkout_session(db: Session, order: Order):
             cancel_url="http://localhost:3000/cancel",
             client_reference_id=str(data.id),
             metadata={"order_id": data.id},
+            expires_at=int(expires_at.timestamp()),
         )
         return session.url, session.id
     except Exception as e:
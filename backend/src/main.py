@@ -4,7 +4,9 @@ from fastapi.staticfiles import StaticFiles
 import asyncio
 import logging
 from contextlib import asynccontextmanager
-from src.shopping.service import cancel_pending_orders
+from src.shopping.service import cancel_expired_orders
+from src.shopping.constants import RESERVATION_SWEEP_INTERVAL, CART_FLUSH_INTERVAL
+from src.shopping.cart_store import cart_store, flush_carts
 from src.users.router import router as userRouter
 from src.products.router import router as productRouter
 from src.shopping.router import router as shoppingRouter
@@ -12,9 +14,20 @@ from src.logistics.router import router as logisticsRouter
 from src.furgonetka.router import router as furgonetkaRouter
 from src.admin.router import router as adminRouter
 from src.email.router import router as emailRouter
+from src.media.router import router as mediaRouter
+from src.recommendations.router import router as recommendationsRouter
 from src.database import engine, Base, SessionLocal
-from src.email.service import delete_too_old
+from src.email.service import delete_too_old, shutdown_email_pool
+from src.shopping.idempotency import delete_expired_idempotency_keys
+from src.shopping.guest_carts import delete_expired_guest_carts
+from src.products.pricing import refresh_price_windows
+from src.recommendations.service import update_recommendations
+from src.products.views import flush_views
+from src.products.stock_shards import rebalance_all_stock_shards
+from src.products.constants import VIEW_FLUSH_INTERVAL
+from src.media.service import media_pool
 from src.users.service import create_superadmin_if_not_exists
+from src.replication import read_your_writes
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -23,19 +36,79 @@ async def run_periodic_tasks(time: int):
   while True:
     db = SessionLocal()
     try:
-      cancel_pending_orders(db, time)
       delete_too_old(db, time)
+      delete_expired_idempotency_keys(db)
+      delete_expired_guest_carts(db)
+      refresh_price_windows(db)
     except Exception as e:
       logger.error(f"Error in periodical tasks: {e}")
     finally:
       db.close()
-      
+
+    await asyncio.to_thread(rebuild_recommendations)
+    await asyncio.sleep(time)
+
+def rebuild_recommendations():
+  db = SessionLocal()
+  try:
+    update_recommendations(db)
+  except Exception as e:
+    logger.error(f"Error while updating recommendations: {e}")
+  finally:
+    db.close()
+
+def flush_buffered_views():
+  db = SessionLocal()
+  try:
+    flush_views(db)
+  except Exception as e:
+    logger.error(f"Error while flushing product views: {e}")
+  finally:
+    db.close()
+
+def sweep_reservations():
+  db = SessionLocal()
+  try:
+    cancel_expired_orders(db)
+    rebalance_all_stock_shards(db)
+  except Exception as e:
+    logger.error(f"Error while releasing expired reservations: {e}")
+  finally:
+    db.close()
+
+async def run_reservation_sweep(time: int):
+  while True:
+    await asyncio.to_thread(sweep_reservations)
+    await asyncio.sleep(time)
+
+async def run_view_flush(time: int):
+  while True:
+    await asyncio.sleep(time)
+    flush_buffered_views()
+
+def flush_cart_store():
+  db = SessionLocal()
+  try:
+    flush_carts(db)
+  except Exception as e:
+    logger.error(f"Error while flushing carts: {e}")
+  finally:
+    db.close()
+
+async def run_cart_flush(time: int):
+  while True:
     await asyncio.sleep(time)
+    flush_cart_store()
     
 @asynccontextmanager
 async def lifespan(app: FastAPI):
   db = SessionLocal()
   task = asyncio.create_task(run_periodic_tasks(1200))
+  views_task = asyncio.create_task(run_view_flush(VIEW_FLUSH_INTERVAL))
+  reservations_task = asyncio.create_task(
+    run_reservation_sweep(RESERVATION_SWEEP_INTERVAL)
+  )
+  cart_task = asyncio.create_task(run_cart_flush(CART_FLUSH_INTERVAL)) if cart_store else None
   try:
         create_superadmin_if_not_exists(db)
   finally:
@@ -44,6 +117,14 @@ async def lifespan(app: FastAPI):
   yield
   
   task.cancel()
+  views_task.cancel()
+  reservations_task.cancel()
+  if cart_task:
+    cart_task.cancel()
+    flush_cart_store()
+  flush_buffered_views()
+  media_pool.shutdown(wait=False, cancel_futures=True)
+  await asyncio.to_thread(shutdown_email_pool)
 
 Base.metadata.create_all(bind=engine)
 app = FastAPI(lifespan=lifespan, title="E-commerce app")
@@ -53,6 +134,7 @@ origins = [
     "http://127.0.0.1:3000",
 ]
 
+app.middleware("http")(read_your_writes)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
@@ -69,3 +151,5 @@ app.include_router(router=logisticsRouter)
 app.include_router(router=furgonetkaRouter)
 app.include_router(router=emailRouter)
 app.include_router(router=adminRouter)
+app.include_router(router=mediaRouter)
+app.include_router(router=recommendationsRouter)
@@ -0,0 +1,23 @@
+from enum import Enum
+import os
+
+UPLOAD_DIR = "static/product_images"
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+ALLOWED_IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp", ".gif"}
+
+THUMBNAIL_SIZE = (320, 320)
+WEBP_MAX_SIZE = (1600, 1600)
+WEBP_QUALITY = 82
+
+MEDIA_WORKERS = int(os.getenv("MEDIA_WORKERS", "2"))
+
+MEDIA_CACHE_DIR = os.getenv("MEDIA_CACHE_DIR", "media_cache")
+MEDIA_CACHE_MAX_BYTES = int(os.getenv("MEDIA_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+MAX_IMAGE_DIMENSION = 2000
+IMAGE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+class ImageFormat(Enum):
+    webp = "webp"
+    jpeg = "jpeg"
+    png = "png"
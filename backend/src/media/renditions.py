@@ -0,0 +1,50 @@
+from PIL import Image, ImageOps
+from src.media.constants import THUMBNAIL_SIZE, WEBP_MAX_SIZE, WEBP_QUALITY
+import os
+
+
+def save_rendition(source_path: str, target_path: str, size, format: str):
+    if os.path.exists(target_path):
+        return target_path
+
+    with Image.open(source_path) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+        image.thumbnail(size)
+
+        temp_path = f"{target_path}.{os.getpid()}.tmp"
+        image.save(temp_path, format=format, quality=WEBP_QUALITY)
+        os.replace(temp_path, target_path)
+
+    return target_path
+
+
+def make_renditions(source_path: str):
+    base_path = os.path.splitext(source_path)[0]
+    return {
+        "thumbnail": save_rendition(
+            source_path, f"{base_path}_thumb.webp", THUMBNAIL_SIZE, "WEBP"
+        ),
+        "webp": save_rendition(
+            source_path, f"{base_path}_{WEBP_MAX_SIZE[0]}.webp", WEBP_MAX_SIZE, "WEBP"
+        ),
+    }
+
+
+def resize_image(source_path: str, target_path: str, width, height, format: str):
+    with Image.open(source_path) as image:
+        image = ImageOps.exif_transpose(image)
+        if format == "JPEG" or image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGB" if format == "JPEG" else "RGBA")
+
+        if width and height:
+            image = ImageOps.fit(image, (width, height))
+        elif width or height:
+            image.thumbnail((width or image.width, height or image.height))
+
+        temp_path = f"{target_path}.{os.getpid()}.tmp"
+        image.save(temp_path, format=format, quality=WEBP_QUALITY)
+        os.replace(temp_path, target_path)
+
+    return os.path.getsize(target_path)
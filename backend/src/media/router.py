@@ -0,0 +1,48 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse
+from sqlalchemy.orm import Session
+from src.dependencies import get_read_db
+from src.media.service import get_image_source, get_resized_image
+from src.media.constants import MAX_IMAGE_DIMENSION, IMAGE_CACHE_CONTROL, ImageFormat
+from typing import Optional
+
+router = APIRouter(prefix="/img", tags=["media"])
+
+
+@router.get("/{image_id}")
+async def get_image(
+    image_id: int,
+    w: Optional[int] = Query(None, ge=1, le=MAX_IMAGE_DIMENSION),
+    h: Optional[int] = Query(None, ge=1, le=MAX_IMAGE_DIMENSION),
+    fmt: ImageFormat = ImageFormat.webp,
+    db: Session = Depends(get_read_db),
+):
+    source = await run_in_threadpool(get_image_source, db, image_id)
+
+    if not source:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Image not found"
+        )
+
+    try:
+        path = await get_resized_image(image_id, source["path"], w, h, fmt)
+    except Exception:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Image could not be processed",
+        )
+
+    if not path:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Image file not found"
+        )
+
+    return FileResponse(
+        path,
+        media_type=f"image/{fmt.value}",
+        headers={
+            "Cache-Control": IMAGE_CACHE_CONTROL,
+            "ETag": f'"{source["etag"]}-{w or 0}x{h or 0}-{fmt.value}"',
+        },
+    )
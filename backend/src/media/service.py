@@ -0,0 +1,126 @@
+from fastapi import UploadFile
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session
+from concurrent.futures import ProcessPoolExecutor
+from src.media.constants import (
+    UPLOAD_DIR,
+    UPLOAD_CHUNK_SIZE,
+    ALLOWED_IMAGE_EXTENSIONS,
+    MEDIA_WORKERS,
+    MEDIA_CACHE_DIR,
+    MEDIA_CACHE_MAX_BYTES,
+    ImageFormat,
+)
+from src.media.renditions import make_renditions, resize_image
+from src.media.disk_cache import DiskLRUCache
+from src.products.models import ProductImage
+import asyncio
+import hashlib
+import multiprocessing
+import os
+import tempfile
+
+media_pool = ProcessPoolExecutor(
+    max_workers=MEDIA_WORKERS, mp_context=multiprocessing.get_context("spawn")
+)
+image_cache = DiskLRUCache(MEDIA_CACHE_DIR, MEDIA_CACHE_MAX_BYTES)
+pending_resizes = {}
+
+
+def to_url(path: str):
+    return f"/{path}".replace("\\", "/")
+
+
+def to_path(url: str):
+    return url.lstrip("/")
+
+
+async def store_upload(file: UploadFile):
+    extension = os.path.splitext(file.filename or "")[1].lower()
+    if extension not in ALLOWED_IMAGE_EXTENSIONS:
+        return None
+
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    hasher = hashlib.sha256()
+    temp = tempfile.NamedTemporaryFile(dir=UPLOAD_DIR, suffix=".part", delete=False)
+    try:
+        while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+            hasher.update(chunk)
+            await run_in_threadpool(temp.write, chunk)
+        temp.close()
+
+        content_hash = hasher.hexdigest()
+        directory = os.path.join(UPLOAD_DIR, content_hash[:2])
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{content_hash}{extension}")
+
+        created = not os.path.exists(path)
+        if created:
+            os.replace(temp.name, path)
+        else:
+            os.remove(temp.name)
+    except BaseException:
+        temp.close()
+        if os.path.exists(temp.name):
+            os.remove(temp.name)
+        raise
+
+    return {"content_hash": content_hash, "path": path, "created": created}
+
+
+async def generate_renditions(path: str):
+    loop = asyncio.get_running_loop()
+    renditions = await loop.run_in_executor(media_pool, make_renditions, path)
+    return {
+        "thumbnail_url": to_url(renditions["thumbnail"]),
+        "webp_url": to_url(renditions["webp"]),
+    }
+
+
+def remove_image_files(*urls):
+    for url in urls:
+        if url and os.path.exists(to_path(url)):
+            os.remove(to_path(url))
+
+
+def get_image_source(db: Session, image_id: int):
+    image = db.query(ProductImage).filter(ProductImage.id == image_id).first()
+    if not image:
+        return None
+    return {"path": to_path(image.url), "etag": image.content_hash or str(image.id)}
+
+
+async def get_resized_image(
+    image_id: int, source_path: str, width, height, format: ImageFormat
+):
+    name = f"{image_id}_{width or 0}x{height or 0}.{format.value}"
+    cached_path = image_cache.get(name)
+    if cached_path:
+        return cached_path
+
+    future = pending_resizes.get(name)
+    if future is None:
+        if not os.path.exists(source_path):
+            return None
+
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(
+            media_pool,
+            resize_image,
+            source_path,
+            image_cache.path(name),
+            width,
+            height,
+            format.value.upper(),
+        )
+        pending_resizes[name] = future
+        future.add_done_callback(lambda done: finish_resize(name, done))
+
+    await asyncio.shield(future)
+    return image_cache.path(name)
+
+
+def finish_resize(name: str, future):
+    pending_resizes.pop(name, None)
+    if not future.cancelled() and future.exception() is None:
+        image_cache.add(name, future.result())
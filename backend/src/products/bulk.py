@@ -0,0 +1,574 @@
+from sqlalchemy import select, text
+from sqlalchemy.orm import Session, aliased
+from pydantic import ValidationError
+from src.database import ReplicaSessionLocal
+from src.products.models import Category, Product
+from src.products.schemas import (
+    ProductImportRow,
+    CategoryImportRow,
+    StockImportRow,
+    ProductBulkUpdateItem,
+)
+from src.products.constants import (
+    BulkEntity,
+    BulkFormat,
+    BULK_CHUNK_SIZE,
+    BULK_MAX_ERRORS,
+    EXPORT_BATCH_SIZE,
+    BULK_UPDATE_CHUNK_SIZE,
+)
+from src.products.pricing import record_base_prices
+from src.products.stock_shards import rebalance_stock_shards
+from src.products.service import (
+    rebuild_category_paths,
+    invalidate_categories,
+    invalidate_category_products,
+)
+from typing import List
+import csv
+import io
+import json
+
+PRODUCT_COLUMNS = [
+    "id",
+    "name",
+    "description",
+    "price",
+    "currency",
+    "stock",
+    "is_active",
+    "category_id",
+]
+CATEGORY_COLUMNS = ["name", "slug", "parent_slug"]
+STOCK_COLUMNS = ["product_id", "stock"]
+
+STAGING_TABLES = {
+    BulkEntity.products: (
+        "product_import",
+        ProductImportRow,
+        PRODUCT_COLUMNS,
+        """
+        id integer, name text, description text, price numeric(10, 2),
+        currency varchar(5), stock integer, is_active boolean, category_id integer
+        """,
+    ),
+    BulkEntity.categories: (
+        "category_import",
+        CategoryImportRow,
+        CATEGORY_COLUMNS,
+        "name text, slug text, parent_slug text",
+    ),
+    BulkEntity.stock: (
+        "stock_import",
+        StockImportRow,
+        STOCK_COLUMNS,
+        "product_id integer, stock integer",
+    ),
+}
+
+
+def read_rows(file, format: BulkFormat):
+    stream = io.TextIOWrapper(file, encoding="utf-8-sig", newline="")
+
+    if format == BulkFormat.csv:
+        reader = csv.DictReader(stream)
+        for row in reader:
+            data = {
+                key: value.strip() or None
+                for key, value in row.items()
+                if key is not None and value is not None
+            }
+            yield reader.line_num, data, None
+        return
+
+    for line_number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            data = json.loads(line)
+        except json.JSONDecodeError as e:
+            yield line_number, None, f"invalid JSON: {e.msg}"
+            continue
+        if not isinstance(data, dict):
+            yield line_number, None, "row must be a JSON object"
+            continue
+        yield line_number, data, None
+
+
+def add_error(result, row_number: int, errors):
+    result["failed"] += 1
+    if len(result["errors"]) < BULK_MAX_ERRORS:
+        result["errors"].append({"row": row_number, "errors": errors})
+
+
+def add_errors(result, rows, message: str):
+    for row in rows:
+        add_error(result, row.row_number, [message])
+
+
+def copy_value(value):
+    if value is None:
+        return "\\N"
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+def copy_chunk(db: Session, table: str, columns, rows):
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write("\t".join(copy_value(value) for value in row) + "\n")
+    buffer.seek(0)
+
+    cursor = db.connection().connection.cursor()
+    cursor.copy_expert(
+        f"COPY {table} (row_number, {', '.join(columns)}) FROM STDIN", buffer
+    )
+
+
+def stage_rows(db: Session, entity: BulkEntity, file, format: BulkFormat, result):
+    table, row_schema, columns, definition = STAGING_TABLES[entity]
+    db.execute(
+        text(
+            f"CREATE TEMP TABLE {table} (row_number integer, {definition}) "
+            "ON COMMIT DROP"
+        )
+    )
+
+    def flush(chunk):
+        rows = []
+        for row_number, data in chunk:
+            try:
+                row = row_schema.model_validate(data)
+            except ValidationError as e:
+                add_error(
+                    result,
+                    row_number,
+                    [
+                        f"{'.'.join(str(loc) for loc in error['loc'])}: {error['msg']}"
+                        for error in e.errors()
+                    ],
+                )
+                continue
+            rows.append([row_number] + [getattr(row, column) for column in columns])
+
+        if rows:
+            copy_chunk(db, table, columns, rows)
+
+    chunk = []
+    for row_number, data, error in read_rows(file, format):
+        result["processed"] += 1
+        if error:
+            add_error(result, row_number, [error])
+            continue
+
+        chunk.append((row_number, data))
+        if len(chunk) >= BULK_CHUNK_SIZE:
+            flush(chunk)
+            chunk = []
+
+    if chunk:
+        flush(chunk)
+
+    db.execute(text(f"ANALYZE {table}"))
+
+
+def reject_duplicates(db: Session, table: str, key: str, result):
+    rows = db.execute(
+        text(
+            f"""
+            DELETE FROM {table} earlier USING {table} later
+            WHERE earlier.{key} = later.{key} AND earlier.row_number < later.row_number
+            RETURNING earlier.row_number
+            """
+        )
+    ).all()
+    add_errors(result, rows, f"{key}: duplicated later in the file")
+
+
+def import_products(db: Session, result):
+    reject_duplicates(db, "product_import", "id", result)
+
+    rows = db.execute(
+        text(
+            """
+            DELETE FROM product_import staged
+            WHERE NOT EXISTS (
+                SELECT 1 FROM category WHERE category.id = staged.category_id
+            )
+            RETURNING staged.row_number
+            """
+        )
+    ).all()
+    add_errors(result, rows, "category_id: category not found")
+
+    rows = db.execute(
+        text(
+            """
+            DELETE FROM product_import staged USING product
+            WHERE product.id = staged.id AND staged.price < product.price
+            RETURNING staged.row_number
+            """
+        )
+    ).all()
+    add_errors(result, rows, "price: to lower a price, use a discount")
+
+    db.execute(
+        text(
+            """
+            SELECT setval(
+                pg_get_serial_sequence('product', 'id'),
+                GREATEST(
+                    (SELECT MAX(id) FROM product),
+                    (SELECT MAX(id) FROM product_import),
+                    1
+                )
+            )
+            """
+        )
+    )
+
+    rows = db.execute(
+        text(
+            """
+            WITH previous AS (
+                SELECT product.id, product.price, product.category_id
+                FROM product JOIN product_import staged ON staged.id = product.id
+            ),
+            upserted AS (
+                INSERT INTO product (
+                    id, name, description, price, currency, stock, is_active,
+                    category_id, views, lowest_price_30_days
+                )
+                SELECT
+                    COALESCE(id, nextval(pg_get_serial_sequence('product', 'id'))),
+                    name, description, price, currency, stock, is_active,
+                    category_id, 0, price
+                FROM product_import
+                ORDER BY row_number
+                ON CONFLICT (id) DO UPDATE SET
+                    name = EXCLUDED.name,
+                    description = EXCLUDED.description,
+                    price = EXCLUDED.price,
+                    currency = EXCLUDED.currency,
+                    stock = EXCLUDED.stock,
+                    is_active = EXCLUDED.is_active,
+                    category_id = EXCLUDED.category_id,
+                    updated_at = now()
+                WHERE (
+                    product.name, product.description, product.price, product.currency,
+                    product.stock, product.is_active, product.category_id
+                ) IS DISTINCT FROM (
+                    EXCLUDED.name, EXCLUDED.description, EXCLUDED.price,
+                    EXCLUDED.currency, EXCLUDED.stock, EXCLUDED.is_active,
+                    EXCLUDED.category_id
+                )
+                RETURNING id, price, category_id, xmax = 0 AS inserted
+            )
+            SELECT
+                upserted.id,
+                upserted.inserted,
+                upserted.category_id,
+                previous.category_id AS previous_category_id,
+                previous.price IS DISTINCT FROM upserted.price AS price_changed
+            FROM upserted LEFT JOIN previous ON previous.id = upserted.id
+            """
+        )
+    ).all()
+
+    record_base_prices(db, [row.id for row in rows if row.price_changed])
+    rebalance_stock_shards(db, [row.id for row in rows if not row.inserted])
+
+    result["inserted"] = sum(1 for row in rows if row.inserted)
+    result["updated"] = len(rows) - result["inserted"]
+    return {row.category_id for row in rows} | {
+        row.previous_category_id for row in rows if row.previous_category_id
+    }
+
+
+def has_category_cycle(db: Session):
+    return db.execute(
+        text(
+            """
+            WITH RECURSIVE tree AS (
+                SELECT id FROM category WHERE parent_id IS NULL
+                UNION ALL
+                SELECT category.id FROM category JOIN tree ON category.parent_id = tree.id
+            )
+            SELECT (SELECT COUNT(*) FROM category) > (SELECT COUNT(*) FROM tree)
+            """
+        )
+    ).scalar()
+
+
+def import_categories(db: Session, result):
+    reject_duplicates(db, "category_import", "slug", result)
+
+    rows = db.execute(
+        text(
+            """
+            DELETE FROM category_import staged
+            WHERE staged.parent_slug IS NOT NULL
+              AND NOT EXISTS (
+                SELECT 1 FROM category WHERE category.slug = staged.parent_slug
+              )
+              AND NOT EXISTS (
+                SELECT 1 FROM category_import parent
+                WHERE parent.slug = staged.parent_slug
+              )
+            RETURNING staged.row_number
+            """
+        )
+    ).all()
+    add_errors(result, rows, "parent_slug: category not found")
+
+    upserted = db.execute(
+        text(
+            """
+            INSERT INTO category (name, slug)
+            SELECT name, slug FROM category_import ORDER BY row_number
+            ON CONFLICT (slug) DO UPDATE SET name = EXCLUDED.name, updated_at = now()
+            WHERE category.name IS DISTINCT FROM EXCLUDED.name
+            RETURNING id, xmax = 0 AS inserted
+            """
+        )
+    ).all()
+
+    moved = db.execute(
+        text(
+            """
+            UPDATE category SET parent_id = parent.id, updated_at = now()
+            FROM category_import staged
+            LEFT JOIN category parent ON parent.slug = staged.parent_slug
+            WHERE category.slug = staged.slug
+              AND category.parent_id IS DISTINCT FROM parent.id
+            RETURNING category.id
+            """
+        )
+    ).all()
+
+    if has_category_cycle(db):
+        return {"error": "cycle"}
+
+    rebuild_category_paths(db)
+
+    inserted = {row.id for row in upserted if row.inserted}
+    changed = {row.id for row in upserted} | {row.id for row in moved}
+    result["inserted"] = len(inserted)
+    result["updated"] = len(changed - inserted)
+    return changed
+
+
+def import_stock(db: Session, result):
+    reject_duplicates(db, "stock_import", "product_id", result)
+
+    rows = db.execute(
+        text(
+            """
+            DELETE FROM stock_import staged
+            WHERE NOT EXISTS (
+                SELECT 1 FROM product WHERE product.id = staged.product_id
+            )
+            RETURNING staged.row_number
+            """
+        )
+    ).all()
+    add_errors(result, rows, "product_id: product not found")
+
+    rows = db.execute(
+        text(
+            """
+            UPDATE product SET stock = staged.stock, updated_at = now()
+            FROM stock_import staged
+            WHERE product.id = staged.product_id AND product.stock <> staged.stock
+            RETURNING product.id, product.category_id
+            """
+        )
+    ).all()
+    rebalance_stock_shards(db, [row.id for row in rows])
+
+    result["updated"] = len(rows)
+    return {row.category_id for row in rows}
+
+
+IMPORTERS = {
+    BulkEntity.products: import_products,
+    BulkEntity.categories: import_categories,
+    BulkEntity.stock: import_stock,
+}
+
+
+def import_catalog(db: Session, entity: BulkEntity, format: BulkFormat, file):
+    result = {
+        "processed": 0,
+        "inserted": 0,
+        "updated": 0,
+        "unchanged": 0,
+        "failed": 0,
+        "errors": [],
+    }
+
+    try:
+        stage_rows(db, entity, file, format, result)
+        changed = IMPORTERS[entity](db, result)
+        if isinstance(changed, dict):
+            db.rollback()
+            return changed
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    if entity == BulkEntity.categories:
+        invalidate_categories(*changed)
+    else:
+        invalidate_category_products(*changed)
+
+    result["errors"].sort(key=lambda error: error["row"])
+    result["unchanged"] = (
+        result["processed"] - result["failed"] - result["inserted"] - result["updated"]
+    )
+    return result
+
+
+def update_products_chunk(db: Session, items):
+    params = {}
+    values = []
+    for i, item in enumerate(items):
+        params[f"id_{i}"] = item.id
+        params[f"price_{i}"] = item.price
+        params[f"stock_{i}"] = item.stock
+        params[f"is_active_{i}"] = item.is_active
+        values.append(
+            f"(CAST(:id_{i} AS integer), CAST(:price_{i} AS numeric), "
+            f"CAST(:stock_{i} AS integer), CAST(:is_active_{i} AS boolean))"
+        )
+
+    return db.execute(
+        text(
+            f"""
+            WITH updates(id, price, stock, is_active) AS (
+                VALUES {", ".join(values)}
+            ),
+            previous AS (
+                SELECT product.id, product.price
+                FROM product JOIN updates ON updates.id = product.id
+            ),
+            changed AS (
+                UPDATE product SET
+                    price = COALESCE(updates.price, product.price),
+                    stock = COALESCE(updates.stock, product.stock),
+                    is_active = COALESCE(updates.is_active, product.is_active),
+                    updated_at = now()
+                FROM updates
+                WHERE product.id = updates.id
+                  AND (updates.price IS NULL OR updates.price >= product.price)
+                  AND (
+                    COALESCE(updates.price, product.price),
+                    COALESCE(updates.stock, product.stock),
+                    COALESCE(updates.is_active, product.is_active)
+                  ) IS DISTINCT FROM (product.price, product.stock, product.is_active)
+                RETURNING product.id, product.price, product.category_id
+            )
+            SELECT
+                updates.id,
+                CASE
+                    WHEN previous.id IS NULL THEN 'not_found'
+                    WHEN updates.price < previous.price THEN 'lower_price'
+                END AS reason,
+                changed.id IS NOT NULL AS updated,
+                changed.category_id,
+                changed.price IS DISTINCT FROM previous.price AS price_changed
+            FROM updates
+            LEFT JOIN previous ON previous.id = updates.id
+            LEFT JOIN changed ON changed.id = updates.id
+            """
+        ),
+        params,
+    ).all()
+
+
+def bulk_update_products(db: Session, items: List[ProductBulkUpdateItem]):
+    latest = {}
+    rejected = []
+    for item in items:
+        if item.id in latest:
+            rejected.append({"id": item.id, "reason": "duplicate"})
+        latest[item.id] = item
+
+    updated = 0
+    category_ids = set()
+    ordered = [latest[id] for id in sorted(latest)]
+    try:
+        for start in range(0, len(ordered), BULK_UPDATE_CHUNK_SIZE):
+            rows = update_products_chunk(
+                db, ordered[start : start + BULK_UPDATE_CHUNK_SIZE]
+            )
+            rejected += [
+                {"id": row.id, "reason": row.reason} for row in rows if row.reason
+            ]
+            changed = [row for row in rows if row.updated]
+            record_base_prices(db, [row.id for row in changed if row.price_changed])
+            rebalance_stock_shards(db, [row.id for row in changed])
+            updated += len(changed)
+            category_ids.update(row.category_id for row in changed)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    invalidate_category_products(*category_ids)
+    return {
+        "updated": updated,
+        "unchanged": len(items) - updated - len(rejected),
+        "rejected": rejected,
+    }
+
+
+def export_query(entity: BulkEntity):
+    if entity == BulkEntity.products:
+        return PRODUCT_COLUMNS, select(
+            *[getattr(Product, column) for column in PRODUCT_COLUMNS]
+        ).order_by(Product.id)
+
+    if entity == BulkEntity.categories:
+        parent = aliased(Category)
+        return CATEGORY_COLUMNS, (
+            select(Category.name, Category.slug, parent.slug.label("parent_slug"))
+            .outerjoin(parent, parent.id == Category.parent_id)
+            .order_by(Category.path, Category.id)
+        )
+
+    return STOCK_COLUMNS, select(Product.id.label("product_id"), Product.stock).order_by(
+        Product.id
+    )
+
+
+def export_catalog(entity: BulkEntity, format: BulkFormat):
+    columns, query = export_query(entity)
+    db = ReplicaSessionLocal()
+    try:
+        rows = db.execute(query.execution_options(yield_per=EXPORT_BATCH_SIZE))
+
+        if format == BulkFormat.csv:
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(columns)
+            for batch in rows.partitions():
+                writer.writerows(batch)
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+            yield buffer.getvalue()
+            return
+
+        for batch in rows.partitions():
+            yield "".join(
+                json.dumps(row._asdict(), default=str) + "\n" for row in batch
+            )
+    finally:
+        db.close()
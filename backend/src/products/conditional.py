@@ -0,0 +1,149 @@
+from fastapi import Request, Response, status
+from sqlalchemy import select, func, case, or_, true, DateTime
+from sqlalchemy.orm import Session
+from src.products.models import Category, Product, Discount, ProductStockShard
+from src.products.service import filter_products
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+import hashlib
+
+
+def discount_transitions(now: datetime, product_id: int = None):
+    last_transition = func.greatest(
+        case((Discount.valid_from <= now, Discount.valid_from)),
+        case((Discount.valid_until <= now, Discount.valid_until)),
+        type_=DateTime,
+    )
+    query = select(func.max(last_transition)).where(
+        or_(Discount.valid_from <= now, Discount.valid_until <= now)
+    )
+    if product_id is not None:
+        query = query.where(Discount.product_id == product_id)
+    return query.scalar_subquery()
+
+
+def shards_last_modified():
+    return func.max(
+        case(
+            (
+                Product.stock_shards > 0,
+                select(func.max(ProductStockShard.updated_at))
+                .where(ProductStockShard.product_id == Product.id)
+                .scalar_subquery(),
+            )
+        )
+    ).label("shards_modified")
+
+
+def get_products_version(db: Session, filters):
+    products = filter_products(
+        select(
+            func.max(Product.updated_at).label("last_modified"),
+            func.count(Product.id).label("count"),
+            shards_last_modified(),
+        ),
+        filters,
+    ).subquery()
+
+    return db.execute(
+        select(
+            func.greatest(
+                products.c.last_modified,
+                products.c.shards_modified,
+                discount_transitions(datetime.now()),
+                type_=DateTime,
+            ),
+            products.c.count,
+        )
+    ).one()
+
+
+def get_product_version(db: Session, product_id: int):
+    products = (
+        select(
+            func.max(Product.updated_at).label("last_modified"),
+            func.count(Product.id).label("count"),
+            shards_last_modified(),
+        )
+        .where(Product.id == product_id)
+        .subquery()
+    )
+
+    return db.execute(
+        select(
+            func.greatest(
+                products.c.last_modified,
+                products.c.shards_modified,
+                discount_transitions(datetime.now(), product_id),
+                type_=DateTime,
+            ),
+            products.c.count,
+        )
+    ).one()
+
+
+def get_categories_version(
+    db: Session, with_products: bool = False, category_id: int = None
+):
+    categories = select(
+        func.max(Category.updated_at).label("last_modified"),
+        func.count(Category.id).label("count"),
+    )
+    products = select(
+        func.max(Product.updated_at).label("last_modified"),
+        func.count(Product.id).label("count"),
+        shards_last_modified(),
+    )
+    if category_id is not None:
+        categories = categories.where(Category.id == category_id)
+        products = products.where(Product.category_id == category_id)
+    categories = categories.subquery()
+    products = products.subquery()
+
+    if not with_products:
+        return db.execute(
+            select(categories.c.last_modified, categories.c.count)
+        ).one()
+
+    return db.execute(
+        select(
+            func.greatest(
+                categories.c.last_modified,
+                products.c.last_modified,
+                products.c.shards_modified,
+                discount_transitions(datetime.now()),
+                type_=DateTime,
+            ),
+            categories.c.count + products.c.count,
+        ).select_from(categories.join(products, true()))
+    ).one()
+
+
+def not_modified(request: Request, response: Response, last_modified, count):
+    if last_modified is None or not count:
+        return None
+
+    version = f"{request.url.path}?{request.url.query}|{last_modified.isoformat()}|{count}"
+    last_modified = last_modified.replace(microsecond=0, tzinfo=timezone.utc)
+    headers = {
+        "ETag": f'"{hashlib.sha1(version.encode()).hexdigest()}"',
+        "Last-Modified": format_datetime(last_modified, usegmt=True),
+        "Cache-Control": "no-cache",
+    }
+
+    if_none_match = request.headers.get("if-none-match")
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_none_match is not None:
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        if headers["ETag"] in tags or "*" in tags:
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    elif if_modified_since is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            since = None
+        if since is not None and since.tzinfo and last_modified <= since:
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    response.headers.update(headers)
+    return None
@@ -0,0 +1,63 @@
+from enum import Enum
+import os
+
+
+class ProductSort(Enum):
+    id = "id"
+    price = "price"
+    created_at = "created_at"
+    name = "name"
+
+
+class PriceSource(Enum):
+    base = "base"
+    discount = "discount"
+
+
+class SortOrder(Enum):
+    asc = "asc"
+    desc = "desc"
+
+
+class BulkEntity(Enum):
+    products = "products"
+    categories = "categories"
+    stock = "stock"
+
+
+class BulkFormat(Enum):
+    csv = "csv"
+    jsonl = "jsonl"
+
+
+DEFAULT_PAGE_SIZE = 24
+MAX_PAGE_SIZE = 100
+MAX_PRICE_IDS = 200
+LOWEST_PRICE_WINDOW_DAYS = 30
+
+CATALOG_CACHE_SIZE = int(os.getenv("CATALOG_CACHE_SIZE", "512"))
+CATALOG_CACHE_TTL = int(os.getenv("CATALOG_CACHE_TTL", "300"))
+
+VIEW_FLUSH_INTERVAL = int(os.getenv("VIEW_FLUSH_INTERVAL", "10"))
+VIEW_FLUSH_BATCH_SIZE = 1000
+
+SEARCH_CONFIG = "simple"
+SEARCH_MAX_OFFSET = 1000
+
+FACET_PRICE_BUCKETS = 10
+MAX_FACET_PRICE_BUCKETS = 50
+
+BULK_CHUNK_SIZE = 1000
+BULK_MAX_ERRORS = 1000
+EXPORT_BATCH_SIZE = 1000
+BULK_UPDATE_CHUNK_SIZE = 1000
+MAX_BULK_UPDATE_ITEMS = 50000
+
+POPULARITY_HALF_LIFE_HOURS = float(os.getenv("POPULARITY_HALF_LIFE_HOURS", "72"))
+POPULARITY_VIEW_WEIGHT = 1.0
+POPULARITY_SALE_WEIGHT = 20.0
+TRENDING_LIMIT = 12
+MAX_TRENDING_LIMIT = 48
+TRENDING_CACHE_TTL = int(os.getenv("TRENDING_CACHE_TTL", "300"))
+
+MAX_STOCK_SHARDS = 64
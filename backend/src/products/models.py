@@ -4,21 +4,38 @@ from sqlalchemy import (
     String,
     ForeignKey,
     Numeric,
+    Float,
     Boolean,
     DateTime,
+    Index,
+    Enum,
+    Computed,
+    UniqueConstraint,
+    DDL,
+    event,
     text,
 )
-from sqlalchemy.orm import relationship
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.orm import relationship, deferred
+from sqlalchemy.ext.hybrid import hybrid_property
 from src.database import Base
-from datetime import datetime, timedelta
+from src.products.constants import PriceSource
+from datetime import datetime
 
 
 class Category(Base):
     __tablename__ = "category"
+    __table_args__ = (
+        Index("ix_category_path", "path", postgresql_ops={"path": "text_pattern_ops"}),
+    )
 
     id = Column(Integer, primary_key=True)
     name = Column(String, nullable=False)
     slug = Column(String, unique=True, nullable=False)
+    path = Column(String, nullable=True)
+    updated_at = Column(
+        DateTime, nullable=False, server_default=text("now()"), onupdate=text("now()")
+    )
 
     parent_id = Column(Integer, ForeignKey("category.id"), nullable=True)
 
@@ -29,6 +46,19 @@ class Category(Base):
 
 class Product(Base):
     __tablename__ = "product"
+    __table_args__ = (
+        Index("ix_product_price_id", "price", "id"),
+        Index("ix_product_created_at_id", "created_at", "id"),
+        Index("ix_product_name_id", "name", "id"),
+        Index("ix_product_category_id_id", "category_id", "id"),
+        Index("ix_product_search_vector", "search_vector", postgresql_using="gin"),
+        Index(
+            "ix_product_name_trgm",
+            "name",
+            postgresql_using="gin",
+            postgresql_ops={"name": "gin_trgm_ops"},
+        ),
+    )
 
     id = Column(Integer, primary_key=True)
     name = Column(String, nullable=False)
@@ -37,11 +67,24 @@ class Product(Base):
     views = Column(Integer, nullable=True, default=0)
     currency = Column(String(5), nullable=False, default="PLN")
     stock = Column(Integer, nullable=False, default=0)
+    reserved = Column(Integer, nullable=False, default=0, server_default="0")
+    stock_shards = Column(Integer, nullable=False, default=0, server_default="0")
     is_active = Column(Boolean, nullable=False, default=True)
+    lowest_price_30_days = Column(Numeric(10, 2), nullable=True)
     created_at = Column(DateTime, nullable=False, server_default=text("now()"))
     updated_at = Column(
         DateTime, nullable=False, server_default=text("now()"), onupdate=text("now()")
     )
+    search_vector = deferred(
+        Column(
+            TSVECTOR,
+            Computed(
+                "setweight(to_tsvector('simple', coalesce(name, '')), 'A') || "
+                "setweight(to_tsvector('simple', coalesce(description, '')), 'B')",
+                persisted=True,
+            ),
+        )
+    )
 
     category_id = Column(Integer, ForeignKey("category.id"), nullable=False)
 
@@ -55,29 +98,39 @@ class Product(Base):
         "Discount", back_populates="product", cascade="all, delete"
     )
 
+    price_history = relationship(
+        "PriceHistory", back_populates="product", cascade="all, delete"
+    )
+
+    _current_price = None
+
+    @hybrid_property
+    def available(self):
+        return self.stock - (self.reserved or 0)
+
+    @available.expression
+    def available(cls):
+        return cls.stock - cls.reserved
+
     @property
     def current_price(self):
-        now = datetime.now()
+        if self._current_price is not None:
+            return self._current_price
         for discount in self.discounts:
             if discount.is_active:
                 return discount.new_price
         return self.price
 
-    @property
-    def lowest_price_30_days(self):
-        thirty_days_ago = datetime.now() - timedelta(days=30)
-
-        prices = [self.price]
-
-        for discount in self.discounts:
-            if discount.valid_from >= thirty_days_ago:
-                prices.append(discount.new_price)
-
-        return min(prices)
+    @current_price.setter
+    def current_price(self, value):
+        self._current_price = value
 
 
 class Discount(Base):
     __tablename__ = "discount"
+    __table_args__ = (
+        Index("ix_discount_product_id_valid_from", "product_id", "valid_from"),
+    )
 
     id = Column(Integer, primary_key=True)
     product_id = Column(Integer, ForeignKey("product.id"), nullable=False)
@@ -95,11 +148,67 @@ class Discount(Base):
         return False
 
 
+class PriceHistory(Base):
+    __tablename__ = "price_history"
+    __table_args__ = (
+        Index("ix_price_history_product_id_recorded_at", "product_id", "recorded_at"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    product_id = Column(Integer, ForeignKey("product.id"), nullable=False)
+    price = Column(Numeric(10, 2), nullable=False)
+    source = Column(Enum(PriceSource), nullable=False)
+    recorded_at = Column(DateTime, nullable=False, server_default=text("now()"))
+
+    product = relationship("Product", back_populates="price_history")
+
+
+class ProductPopularity(Base):
+    __tablename__ = "product_popularity"
+    __table_args__ = (
+        Index("ix_product_popularity_trend_key", "trend_key"),
+    )
+
+    product_id = Column(
+        Integer, ForeignKey("product.id", ondelete="CASCADE"), primary_key=True
+    )
+    score = Column(Float, nullable=False)
+    trend_key = Column(Float, nullable=False)
+    scored_at = Column(DateTime, nullable=False, server_default=text("now()"))
+
+
+class ProductStockShard(Base):
+    __tablename__ = "product_stock_shard"
+
+    product_id = Column(
+        Integer, ForeignKey("product.id", ondelete="CASCADE"), primary_key=True
+    )
+    shard = Column(Integer, primary_key=True)
+    allocated = Column(Integer, nullable=False, default=0)
+    reserved = Column(Integer, nullable=False, default=0)
+    updated_at = Column(
+        DateTime, nullable=False, server_default=text("now()"), onupdate=text("now()")
+    )
+
+
 class ProductImage(Base):
     __tablename__ = "product_image"
+    __table_args__ = (
+        UniqueConstraint("product_id", "content_hash"),
+    )
     id = Column(Integer, primary_key=True)
     product_id = Column(Integer, ForeignKey("product.id"), nullable=False)
-    url = Column(String, nullable=False, unique=True)
+    url = Column(String, nullable=False)
     is_main = Column(Boolean, default=False, nullable=False)
+    content_hash = Column(String(64), nullable=True, index=True)
+    thumbnail_url = Column(String, nullable=True)
+    webp_url = Column(String, nullable=True)
 
     product = relationship("Product", back_populates="images")
+
+
+event.listen(
+    Base.metadata,
+    "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql"),
+)
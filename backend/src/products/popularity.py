@@ -0,0 +1,97 @@
+from sqlalchemy import text, func
+from sqlalchemy.orm import Session, selectinload
+from src.cache import TTLCache
+from src.products.models import Product, ProductPopularity
+from src.products.schemas import ProductOut
+from src.products.pricing import apply_prices
+from src.products.constants import (
+    POPULARITY_HALF_LIFE_HOURS,
+    POPULARITY_VIEW_WEIGHT,
+    POPULARITY_SALE_WEIGHT,
+    TRENDING_CACHE_TTL,
+)
+from src.shopping.models import OrderItem
+import math
+
+DECAY_PER_SECOND = math.log(2) / (POPULARITY_HALF_LIFE_HOURS * 3600)
+
+DECAYED_SCORE = """
+    product_popularity.score * exp(
+        -:decay * extract(epoch FROM now() - product_popularity.scored_at)
+    ) + EXCLUDED.score
+"""
+
+trending_cache = TTLCache("trending", 16, TRENDING_CACHE_TTL)
+
+
+def add_popularity(db: Session, weights):
+    items = sorted((id, weight) for id, weight in weights.items() if weight > 0)
+    if not items:
+        return
+
+    params = {"decay": DECAY_PER_SECOND}
+    values = []
+    for i, (product_id, weight) in enumerate(items):
+        params[f"id_{i}"] = product_id
+        params[f"weight_{i}"] = weight
+        values.append(f"(CAST(:id_{i} AS integer), CAST(:weight_{i} AS float))")
+
+    db.execute(
+        text(
+            f"""
+            INSERT INTO product_popularity (product_id, score, trend_key, scored_at)
+            SELECT v.id, v.weight,
+                   ln(v.weight) + :decay * extract(epoch FROM now()), now()
+            FROM (VALUES {", ".join(values)}) AS v(id, weight)
+            JOIN product ON product.id = v.id
+            ON CONFLICT (product_id) DO UPDATE SET
+                score = {DECAYED_SCORE},
+                trend_key = ln({DECAYED_SCORE}) + :decay * extract(epoch FROM now()),
+                scored_at = now()
+            """
+        ),
+        params,
+    )
+
+
+def record_views_popularity(db: Session, views):
+    add_popularity(
+        db,
+        {
+            product_id: count * POPULARITY_VIEW_WEIGHT
+            for product_id, count in views.items()
+        },
+    )
+
+
+def record_sales_popularity(db: Session, order_id: int):
+    sales = (
+        db.query(OrderItem.product_id, func.sum(OrderItem.quantity))
+        .filter(OrderItem.order_id == order_id)
+        .group_by(OrderItem.product_id)
+        .all()
+    )
+    add_popularity(
+        db,
+        {
+            product_id: quantity * POPULARITY_SALE_WEIGHT
+            for product_id, quantity in sales
+        },
+    )
+
+
+def get_trending_products(db: Session, limit: int):
+    def load():
+        products = (
+            db.query(Product)
+            .join(ProductPopularity, ProductPopularity.product_id == Product.id)
+            .options(selectinload(Product.images))
+            .filter(Product.is_active == True)
+            .order_by(ProductPopularity.trend_key.desc())
+            .limit(limit)
+            .all()
+        )
+        apply_prices(db, products)
+        return [ProductOut.model_validate(p).model_dump() for p in products]
+
+    return trending_cache.get_or_set(limit, load)
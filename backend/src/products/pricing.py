@@ -0,0 +1,174 @@
+from sqlalchemy import (
+    select,
+    insert,
+    exists,
+    literal,
+    cast,
+    union_all,
+    or_,
+    text,
+    DateTime,
+)
+from sqlalchemy.orm import Session
+from src.products.models import Product, Discount, PriceHistory
+from src.products.constants import PriceSource, LOWEST_PRICE_WINDOW_DAYS
+from datetime import datetime
+
+
+def get_prices(db: Session, product_ids):
+    ids = set(product_ids)
+    if not ids:
+        return {}
+
+    now = datetime.now()
+    active_discount = (
+        select(Discount.product_id, Discount.new_price)
+        .where(
+            Discount.product_id.in_(ids),
+            Discount.valid_from <= now,
+            or_(Discount.valid_until == None, Discount.valid_until > now),
+        )
+        .distinct(Discount.product_id)
+        .order_by(Discount.product_id, Discount.valid_from.desc())
+        .subquery()
+    )
+
+    rows = db.execute(
+        select(
+            Product.id,
+            Product.price,
+            Product.currency,
+            Product.lowest_price_30_days,
+            active_discount.c.new_price,
+        )
+        .outerjoin(active_discount, active_discount.c.product_id == Product.id)
+        .where(Product.id.in_(ids))
+    ).all()
+
+    prices = {}
+    for row in rows:
+        current_price = row.new_price if row.new_price is not None else row.price
+        lowest_price = row.lowest_price_30_days
+        if lowest_price is None:
+            lowest_price = min(row.price, current_price)
+        prices[row.id] = {
+            "product_id": row.id,
+            "price": row.price,
+            "current_price": current_price,
+            "lowest_price_30_days": lowest_price,
+            "currency": row.currency,
+        }
+    return prices
+
+
+def apply_prices(db: Session, products):
+    products = [product for product in products if product is not None]
+    prices = get_prices(db, [product.id for product in products])
+
+    for product in products:
+        price = prices.get(product.id)
+        if price:
+            product.current_price = price["current_price"]
+
+    return products
+
+
+def record_base_price(db: Session, product: Product):
+    record_base_prices(db, [product.id])
+
+
+def record_base_prices(db: Session, product_ids):
+    ids = list(product_ids)
+    if not ids:
+        return
+
+    db.flush()
+    now = datetime.now()
+    source_type = PriceHistory.__table__.c.source.type
+    base = cast(literal(PriceSource.base, source_type), source_type)
+    active_discount = exists().where(
+        Discount.product_id == Product.id,
+        Discount.valid_from <= now,
+        or_(Discount.valid_until == None, Discount.valid_until > now),
+    )
+
+    db.execute(
+        insert(PriceHistory).from_select(
+            ["product_id", "price", "source", "recorded_at"],
+            union_all(
+                select(Product.id, Product.price, base, literal(now, DateTime)).where(
+                    Product.id.in_(ids), ~active_discount
+                ),
+                select(Product.id, Product.price, base, Discount.valid_until)
+                .join(Discount, Discount.product_id == Product.id)
+                .where(Product.id.in_(ids), Discount.valid_until > now),
+            ),
+        )
+    )
+    refresh_lowest_prices(db, ids)
+
+
+def record_discount_price(db: Session, product: Product, discount: Discount):
+    db.add(
+        PriceHistory(
+            product_id=product.id,
+            price=discount.new_price,
+            source=PriceSource.discount,
+            recorded_at=discount.valid_from,
+        )
+    )
+    if discount.valid_until:
+        db.add(
+            PriceHistory(
+                product_id=product.id,
+                price=product.price,
+                source=PriceSource.base,
+                recorded_at=discount.valid_until,
+            )
+        )
+
+    db.flush()
+    refresh_lowest_prices(db, [product.id])
+
+
+def refresh_lowest_prices(db: Session, product_ids=None):
+    product_filter = ""
+    params = {"window": f"{LOWEST_PRICE_WINDOW_DAYS} days"}
+    if product_ids is not None:
+        product_filter = "AND product_id = ANY(:ids)"
+        params["ids"] = list(product_ids)
+
+    db.execute(
+        text(
+            f"""
+            UPDATE product
+            SET lowest_price_30_days = prices.lowest_price, updated_at = now()
+            FROM (
+                SELECT product_id, MIN(price) AS lowest_price FROM (
+                    (
+                        SELECT product_id, price FROM price_history
+                        WHERE recorded_at > now() - CAST(:window AS interval)
+                          AND recorded_at <= now() {product_filter}
+                    )
+                    UNION ALL
+                    (
+                        SELECT DISTINCT ON (product_id) product_id, price
+                        FROM price_history
+                        WHERE recorded_at <= now() - CAST(:window AS interval)
+                          {product_filter}
+                        ORDER BY product_id, recorded_at DESC, id DESC
+                    )
+                ) window_prices
+                GROUP BY product_id
+            ) prices
+            WHERE product.id = prices.product_id
+              AND product.lowest_price_30_days IS DISTINCT FROM prices.lowest_price
+            """
+        ),
+        params,
+    )
+
+
+def refresh_price_windows(db: Session):
+    refresh_lowest_prices(db)
+    db.commit()
@@ -1,14 +1,33 @@
-from fastapi import APIRouter, Depends, HTTPException, status, File, UploadFile, Form
+from fastapi import (
+    APIRouter,
+    Depends,
+    HTTPException,
+    status,
+    File,
+    UploadFile,
+    Form,
+    Query,
+    Request,
+    Response,
+)
 from sqlalchemy.orm import Session
 from src.users.models import User
-from src.dependencies import get_db
+from src.dependencies import get_db, get_read_db
 from src.products.schemas import (
     CategoryOut,
     CategoryUpdate,
     CategoryProductsOut,
+    CategoryTreeOut,
     CategoryCreate,
     StatusResponse,
     ProductOut,
+    ProductPage,
+    ProductFilters,
+    ProductPriceOut,
+    SearchFilters,
+    SearchPage,
+    FacetFilters,
+    FacetsOut,
     ProductCreate,
     ProductUpdate,
     ProductImageCreate,
@@ -16,16 +35,24 @@ from src.products.schemas import (
     ProductImageOut,
     DiscountCreate,
     DiscountOut,
+    BulkImportResult,
+    ProductBulkUpdate,
+    ProductBulkUpdateResult,
+    StockShardsUpdate,
+    StockLevelsOut,
 )
 from src.products.service import (
     get_list_of_categories,
     get_all_categories_with_products,
     get_single_category,
+    get_category_tree,
     create_category,
     update_category,
     delete_category,
     get_all_products,
     get_all_products_from_category,
+    search_products,
+    get_product_facets,
     get_single_product,
     create_product,
     update_product,
@@ -37,12 +64,37 @@ from src.products.service import (
     add_discount,
     cancel_discount,
 )
+from src.products.pricing import get_prices
+from src.products.popularity import get_trending_products
+from src.products.bulk import import_catalog, export_catalog, bulk_update_products
+from src.products.views import record_view
+from src.products.stock_shards import get_stock_levels, set_stock_shards
+from src.products.conditional import (
+    not_modified,
+    get_products_version,
+    get_product_version,
+    get_categories_version,
+)
+from src.products.constants import (
+    MAX_PRICE_IDS,
+    TRENDING_LIMIT,
+    MAX_TRENDING_LIMIT,
+    BulkEntity,
+    BulkFormat,
+)
+from fastapi.responses import StreamingResponse
 from src.constants import user_required, admin_required, superadmin_required, allow_any
 from typing import List
-import shutil
+from fastapi.concurrency import run_in_threadpool
+from src.media.service import (
+    store_upload,
+    generate_renditions,
+    remove_image_files,
+    to_url,
+)
+from src.media.constants import UPLOAD_DIR
 import os
 
-UPLOAD_DIR = "static/product_images"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 router = APIRouter(prefix="/shop", tags=["products"])
 
@@ -54,8 +106,16 @@ router = APIRouter(prefix="/shop", tags=["products"])
     description="Returns list of categories (without products assigned) ",
 )
 def get_categories(
-    db: Session = Depends(get_db)
+    request: Request,
+    response: Response,
+    db: Session = Depends(get_read_db),
 ):
+    cached_response = not_modified(
+        request, response, *get_categories_version(db)
+    )
+    if cached_response:
+        return cached_response
+
     categories = get_list_of_categories(db)
 
     if not categories:
@@ -73,8 +133,16 @@ def get_categories(
     description="Returns list of categories including products assigned",
 )
 def get_categories_products(
-    db: Session = Depends(get_db)
+    request: Request,
+    response: Response,
+    db: Session = Depends(get_read_db),
 ):
+    cached_response = not_modified(
+        request, response, *get_categories_version(db, with_products=True)
+    )
+    if cached_response:
+        return cached_response
+
     categories_products = get_all_categories_with_products(db)
 
     if not categories_products:
@@ -85,6 +153,33 @@ def get_categories_products(
     return categories_products
 
 
+@router.get(
+    "/category-tree",
+    response_model=List[CategoryTreeOut],
+    status_code=status.HTTP_200_OK,
+    description="Returns whole category hierarchy as nested tree",
+)
+def get_categories_tree(
+    request: Request,
+    response: Response,
+    db: Session = Depends(get_read_db),
+):
+    cached_response = not_modified(
+        request, response, *get_categories_version(db)
+    )
+    if cached_response:
+        return cached_response
+
+    tree = get_category_tree(db)
+
+    if not tree:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Categories don't exist"
+        )
+
+    return tree
+
+
 @router.get(
     "/categories/{category_id}",
     response_model=CategoryProductsOut,
@@ -93,8 +188,18 @@ def get_categories_products(
 )
 def get_category(
     category_id: int,
-    db: Session = Depends(get_db),
+    request: Request,
+    response: Response,
+    db: Session = Depends(get_read_db),
 ):
+    cached_response = not_modified(
+        request,
+        response,
+        *get_categories_version(db, with_products=True, category_id=category_id),
+    )
+    if cached_response:
+        return cached_response
+
     category = get_single_category(db, category_id)
 
     if not category:
@@ -147,6 +252,12 @@ def put_category(
             status_code=status.HTTP_404_NOT_FOUND, detail="Category not found"
         )
 
+    if isinstance(edited_category, dict) and edited_category["error"] == "cycle":
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Category can't be moved into its own subtree",
+        )
+
     return edited_category
 
 
@@ -168,45 +279,143 @@ def del_category(
             status_code=status.HTTP_404_NOT_FOUND, detail="Category not found"
         )
 
+    if isinstance(deleted, dict) and deleted["error"] == "has_children":
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Category has subcategories, move or delete them first",
+        )
+
     return {"status": "deleted"}
 
 
 @router.get(
     "/products",
-    response_model=List[ProductOut],
+    response_model=ProductPage,
     status_code=status.HTTP_200_OK,
-    description="Returns every single product in db",
+    description="Returns a page of products, pass next_cursor back as cursor to get the next one",
 )
 def get_every_product(
-    db: Session = Depends(get_db)
+    request: Request,
+    response: Response,
+    filters: ProductFilters = Depends(),
+    db: Session = Depends(get_read_db),
 ):
-    products = get_all_products(db)
+    cached_response = not_modified(
+        request, response, *get_products_version(db, filters)
+    )
+    if cached_response:
+        return cached_response
+
+    page = get_all_products(db, filters)
+
+    if page is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor"
+        )
 
-    if not products:
+    if not page["items"]:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="There are no products"
         )
 
-    return products
+    return page
 
 
 @router.get(
-    "/products/{category_id}",
+    "/products/facets",
+    response_model=FacetsOut,
+    status_code=status.HTTP_200_OK,
+    description="Returns category, price and stock counts for products matching filters",
+)
+def get_products_facets(
+    filters: FacetFilters = Depends(),
+    db: Session = Depends(get_read_db),
+):
+    return get_product_facets(db, filters)
+
+
+@router.get(
+    "/products/trending",
     response_model=List[ProductOut],
     status_code=status.HTTP_200_OK,
+    description="Returns products ranked by recent views and sales",
+)
+def get_trending(
+    limit: int = Query(TRENDING_LIMIT, gt=0, le=MAX_TRENDING_LIMIT),
+    db: Session = Depends(get_read_db),
+):
+    return get_trending_products(db, limit)
+
+
+@router.get(
+    "/products/{category_id}",
+    response_model=ProductPage,
+    status_code=status.HTTP_200_OK,
+    description="Returns a page of products from category",
 )
 def get_every_product_from_category(
     category_id: int,
-    db: Session = Depends(get_db),
+    request: Request,
+    response: Response,
+    filters: ProductFilters = Depends(),
+    db: Session = Depends(get_read_db),
 ):
-    products = get_all_products_from_category(db, category_id)
+    cached_response = not_modified(
+        request,
+        response,
+        *get_products_version(
+            db, filters.model_copy(update={"category_id": category_id})
+        ),
+    )
+    if cached_response:
+        return cached_response
+
+    page = get_all_products_from_category(db, category_id, filters)
+
+    if page is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor"
+        )
 
-    if not products:
+    if not page["items"]:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="There are no products"
         )
 
-    return products
+    return page
+
+
+@router.get(
+    "/search",
+    response_model=SearchPage,
+    status_code=status.HTTP_200_OK,
+    description="Full-text search over product names and descriptions, tolerant to typos",
+)
+def get_search_results(
+    filters: SearchFilters = Depends(),
+    db: Session = Depends(get_read_db),
+):
+    return search_products(db, filters)
+
+
+@router.get(
+    "/prices",
+    response_model=List[ProductPriceOut],
+    status_code=status.HTTP_200_OK,
+    description="Returns current prices for given product ids (?ids=1&ids=2)",
+)
+def get_product_prices(
+    ids: List[int] = Query(..., max_length=MAX_PRICE_IDS),
+    db: Session = Depends(get_read_db),
+):
+    prices = get_prices(db, ids)
+
+    if not prices:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="There are no products"
+        )
+
+    return list(prices.values())
 
 
 @router.get(
@@ -214,8 +423,17 @@ def get_every_product_from_category(
 )
 def get_one_product(
     product_id: int,
-    db: Session = Depends(get_db),
+    request: Request,
+    response: Response,
+    db: Session = Depends(get_read_db),
 ):
+    cached_response = not_modified(
+        request, response, *get_product_version(db, product_id)
+    )
+    if cached_response:
+        record_view(product_id)
+        return cached_response
+
     product = get_single_product(db, product_id)
 
     if not product:
@@ -224,8 +442,7 @@ def get_one_product(
             detail=f"There is no product with id {product_id}",
         )
 
-    product.views += 1
-    db.commit()
+    record_view(product_id)
 
     return product
 
@@ -247,6 +464,50 @@ def post_product(
     return new_product
 
 
+@router.patch("/products/bulk", response_model=ProductBulkUpdateResult)
+def patch_products_bulk(
+    request: ProductBulkUpdate,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(admin_required),
+):
+    return bulk_update_products(db, request.items)
+
+
+@router.get("/product/{product_id}/stock", response_model=StockLevelsOut)
+def get_product_stock(
+    product_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(admin_required),
+):
+    stock_levels = get_stock_levels(db, product_id)
+
+    if not stock_levels:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"There is no product with id {product_id}",
+        )
+
+    return stock_levels
+
+
+@router.put("/product/{product_id}/stock-shards", response_model=StockLevelsOut)
+def put_product_stock_shards(
+    product_id: int,
+    request: StockShardsUpdate,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(admin_required),
+):
+    stock_levels = set_stock_shards(db, product_id, request.shards)
+
+    if not stock_levels:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"There is no product with id {product_id}",
+        )
+
+    return stock_levels
+
+
 @router.put(
     "/product/{product_id}", response_model=ProductOut, status_code=status.HTTP_200_OK
 )
@@ -303,7 +564,7 @@ def del_product(
 )
 def get_every_product_image(
     product_id: int,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     images = get_all_product_images_for_product(product_id, db)
 
@@ -333,10 +594,12 @@ def del_image(
             status_code=status.HTTP_404_NOT_FOUND, detail="Image not found in database"
         )
 
-    file_path = deleted_image_data["url"].lstrip("/")
-
-    if os.path.exists(file_path):
-        os.remove(file_path)
+    if not deleted_image_data["shared"]:
+        remove_image_files(
+            deleted_image_data["url"],
+            deleted_image_data["thumbnail_url"],
+            deleted_image_data["webp_url"],
+        )
 
     return {"status": "deleted"}
 
@@ -346,26 +609,40 @@ def del_image(
     response_model=ProductImageOut,
     status_code=status.HTTP_201_CREATED,
 )
-def post_image(
+async def post_image(
     product_id: int,
     is_main: bool = Form(False),
     file: UploadFile = File(...),
     db: Session = Depends(get_db),
     current_user: User = Depends(admin_required),
 ):
-    file_name = f"{product_id}_{file.filename}"
-    file_path = os.path.join(UPLOAD_DIR, file_name)
+    stored_file = await store_upload(file)
 
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    if not stored_file:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Unsupported image format",
+        )
 
-    web_url = f"/{file_path}".replace("\\", "/")
+    try:
+        renditions = await generate_renditions(stored_file["path"])
+    except Exception:
+        if stored_file["created"]:
+            remove_image_files(to_url(stored_file["path"]))
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="File is not a valid image",
+        )
 
     new_image_data = ProductImageCreate(
-        product_id=product_id, url=web_url, is_main=is_main
+        product_id=product_id,
+        url=to_url(stored_file["path"]),
+        is_main=is_main,
+        content_hash=stored_file["content_hash"],
+        **renditions,
     )
 
-    return create_product_image(new_image_data, db)
+    return await run_in_threadpool(create_product_image, new_image_data, db)
 
 
 @router.put(
@@ -400,7 +677,7 @@ def post_discount(
     db: Session = Depends(get_db),
     current_user: User = Depends(admin_required),
 ):
-    new_discount = add_discount(db, product_id, **discount_data.model_dump())
+    new_discount = add_discount(db, product_id, discount_data)
 
     if not new_discount:
         raise HTTPException(
@@ -430,3 +707,38 @@ def del_discount(
         )
 
     return {"status": "deleted"}
+
+
+@router.post("/import/{entity}", response_model=BulkImportResult)
+def import_catalog_file(
+    entity: BulkEntity,
+    format: BulkFormat = BulkFormat.csv,
+    file: UploadFile = File(...),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(admin_required),
+):
+    result = import_catalog(db, entity, format, file.file)
+
+    if result.get("error") == "cycle":
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Import would create a cycle in the category tree",
+        )
+
+    return result
+
+
+@router.get("/export/{entity}")
+def export_catalog_file(
+    entity: BulkEntity,
+    format: BulkFormat = BulkFormat.csv,
+    current_user: User = Depends(admin_required),
+):
+    media_type = "text/csv" if format == BulkFormat.csv else "application/x-ndjson"
+    return StreamingResponse(
+        export_catalog(entity, format),
+        media_type=media_type,
+        headers={
+            "Content-Disposition": f'attachment; filename="{entity.value}.{format.value}"'
+        },
+    )
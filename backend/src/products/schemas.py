@@ -1,7 +1,18 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import List, Optional
 from decimal import Decimal
 from datetime import datetime
+from src.products.constants import (
+    ProductSort,
+    SortOrder,
+    DEFAULT_PAGE_SIZE,
+    MAX_PAGE_SIZE,
+    SEARCH_MAX_OFFSET,
+    FACET_PRICE_BUCKETS,
+    MAX_FACET_PRICE_BUCKETS,
+    MAX_BULK_UPDATE_ITEMS,
+    MAX_STOCK_SHARDS,
+)
 
 
 class BaseProduct(BaseModel):
@@ -19,6 +30,8 @@ class BaseImage(BaseModel):
     product_id: int
     url: str
     is_main: Optional[bool] = None
+    thumbnail_url: Optional[str] = None
+    webp_url: Optional[str] = None
 
 
 class ImageOut(BaseImage):
@@ -30,6 +43,8 @@ class ProductImageBase(BaseModel):
     product_id: int
     url: str
     is_main: Optional[bool] = False
+    thumbnail_url: Optional[str] = None
+    webp_url: Optional[str] = None
 
 
 class ProductImageOut(ProductImageBase):
@@ -41,14 +56,101 @@ class ProductImageOut(ProductImageBase):
 
 class ProductOut(BaseProduct):
     id: int
+    available: Optional[int] = None
     images: Optional[List[ProductImageOut]] = []
     current_price: Decimal
-    lowest_price_30_days: Decimal
+    lowest_price_30_days: Optional[Decimal] = None
 
     class Config:
         from_attributes = True
 
 
+class ProductPriceOut(BaseModel):
+    product_id: int
+    price: Decimal
+    current_price: Decimal
+    lowest_price_30_days: Decimal
+    currency: str
+
+
+class ProductFilters(BaseModel):
+    cursor: Optional[str] = None
+    limit: int = Field(default=DEFAULT_PAGE_SIZE, gt=0, le=MAX_PAGE_SIZE)
+    sort: ProductSort = ProductSort.id
+    order: SortOrder = SortOrder.asc
+    min_price: Optional[Decimal] = Field(default=None, ge=0)
+    max_price: Optional[Decimal] = Field(default=None, ge=0)
+    in_stock: Optional[bool] = None
+    is_active: Optional[bool] = None
+    category_id: Optional[int] = None
+    include_descendants: bool = False
+
+
+class ProductPage(BaseModel):
+    items: List[ProductOut]
+    next_cursor: Optional[str] = None
+
+
+class FacetFilters(BaseModel):
+    min_price: Optional[Decimal] = Field(default=None, ge=0)
+    max_price: Optional[Decimal] = Field(default=None, ge=0)
+    in_stock: Optional[bool] = None
+    is_active: Optional[bool] = None
+    category_id: Optional[int] = None
+    include_descendants: bool = False
+    buckets: int = Field(default=FACET_PRICE_BUCKETS, gt=0, le=MAX_FACET_PRICE_BUCKETS)
+
+
+class CategoryFacet(BaseModel):
+    category_id: int
+    count: int
+
+
+class PriceBucketFacet(BaseModel):
+    bucket: int
+    range_from: Decimal
+    range_to: Decimal
+    min_price: Decimal
+    max_price: Decimal
+    count: int
+
+
+class StockFacet(BaseModel):
+    in_stock: int = 0
+    out_of_stock: int = 0
+
+
+class FacetsOut(BaseModel):
+    total: int
+    categories: List[CategoryFacet]
+    price_buckets: List[PriceBucketFacet]
+    stock: StockFacet
+
+
+class SearchFilters(BaseModel):
+    q: str = Field(min_length=1, max_length=200)
+    limit: int = Field(default=DEFAULT_PAGE_SIZE, gt=0, le=MAX_PAGE_SIZE)
+    offset: int = Field(default=0, ge=0, le=SEARCH_MAX_OFFSET)
+    min_price: Optional[Decimal] = Field(default=None, ge=0)
+    max_price: Optional[Decimal] = Field(default=None, ge=0)
+    in_stock: Optional[bool] = None
+    is_active: Optional[bool] = True
+    category_id: Optional[int] = None
+    include_descendants: bool = False
+
+
+class SearchHit(BaseModel):
+    product: ProductOut
+    rank: float
+    name_highlight: str
+    description_highlight: Optional[str] = None
+
+
+class SearchPage(BaseModel):
+    items: List[SearchHit]
+    next_offset: Optional[int] = None
+
+
 class ProductCreate(BaseProduct):
     class Config:
         from_attributes = True
@@ -59,6 +161,88 @@ class ProductUpdate(BaseProduct):
         from_attributes = True
 
 
+class ProductImportRow(BaseModel):
+    id: Optional[int] = Field(default=None, gt=0)
+    name: str = Field(min_length=1)
+    description: Optional[str] = None
+    price: Decimal = Field(gt=0, max_digits=10, decimal_places=2)
+    currency: str = Field(default="PLN", max_length=5)
+    stock: int = Field(default=0, ge=0)
+    is_active: bool = True
+    category_id: int
+
+
+class CategoryImportRow(BaseModel):
+    name: str = Field(min_length=1)
+    slug: str = Field(min_length=1)
+    parent_slug: Optional[str] = None
+
+
+class StockImportRow(BaseModel):
+    product_id: int
+    stock: int = Field(ge=0)
+
+
+class ProductBulkUpdateItem(BaseModel):
+    id: int
+    price: Optional[Decimal] = Field(default=None, gt=0, max_digits=10, decimal_places=2)
+    stock: Optional[int] = Field(default=None, ge=0)
+    is_active: Optional[bool] = None
+
+
+class ProductBulkUpdate(BaseModel):
+    items: List[ProductBulkUpdateItem] = Field(
+        min_length=1, max_length=MAX_BULK_UPDATE_ITEMS
+    )
+
+
+class BulkRejectedItem(BaseModel):
+    id: int
+    reason: str
+
+
+class ProductBulkUpdateResult(BaseModel):
+    updated: int
+    unchanged: int
+    rejected: List[BulkRejectedItem]
+
+
+class StockShardsUpdate(BaseModel):
+    shards: int = Field(ge=0, le=MAX_STOCK_SHARDS)
+
+
+class StockShardOut(BaseModel):
+    shard: int
+    allocated: int
+    reserved: int
+
+    class Config:
+        from_attributes = True
+
+
+class StockLevelsOut(BaseModel):
+    product_id: int
+    stock: int
+    reserved: int
+    available: int
+    stock_shards: int
+    shards: List[StockShardOut]
+
+
+class BulkRowError(BaseModel):
+    row: int
+    errors: List[str]
+
+
+class BulkImportResult(BaseModel):
+    processed: int
+    inserted: int
+    updated: int
+    unchanged: int
+    failed: int
+    errors: List[BulkRowError]
+
+
 class BaseCategory(BaseModel):
     name: str
     slug: str
@@ -80,6 +264,11 @@ class CategoryOut(BaseCategory):
         from_attributes = True
 
 
+class CategoryTreeOut(BaseCategory):
+    id: int
+    children: List["CategoryTreeOut"] = []
+
+
 class CategoryCreate(BaseCategory):
     pass
 
@@ -96,6 +285,9 @@ class ProductImageCreate(BaseModel):
     product_id: int
     url: str
     is_main: bool = False
+    content_hash: Optional[str] = None
+    thumbnail_url: Optional[str] = None
+    webp_url: Optional[str] = None
 
     class Config:
         from_attributes = True
@@ -117,7 +309,7 @@ class DiscountCreate(BaseModel):
 class DiscountOut(BaseModel):
     id: int
     product_id: int
-    new_price: int
+    new_price: Decimal
     created_at: datetime
     valid_from: datetime
     valid_until: datetime
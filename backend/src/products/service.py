@@ -1,5 +1,5 @@
-from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import or_
+from sqlalchemy.orm import Session, joinedload, selectinload
+from sqlalchemy import or_, tuple_, select, func, text, true
 from src.products.models import Category, Product, ProductImage, Discount
 from src.products.schemas import (
     CategoryCreate,
@@ -9,33 +9,149 @@ from src.products.schemas import (
     ProductImageCreate,
     ProductImageEdit,
     DiscountCreate,
+    ProductFilters,
+    SearchFilters,
+    FacetFilters,
+    CategoryOut,
+    CategoryProductsOut,
 )
-from decimal import Decimal
+from src.products.constants import (
+    ProductSort,
+    SortOrder,
+    CATALOG_CACHE_SIZE,
+    CATALOG_CACHE_TTL,
+    SEARCH_CONFIG,
+)
+from src.cache import TTLCache
+from src.products.pricing import (
+    apply_prices,
+    record_base_price,
+    record_discount_price,
+)
+from src.products.stock_shards import rebalance_stock_shards
+from decimal import Decimal, InvalidOperation
 from datetime import datetime
+import base64
+import binascii
+import json
+
+SORT_COLUMNS = {
+    ProductSort.id: Product.id,
+    ProductSort.price: Product.price,
+    ProductSort.created_at: Product.created_at,
+    ProductSort.name: Product.name,
+}
+
+PRICE_BUCKET_STEP = Decimal("0.01")
+
+catalog_cache = TTLCache("catalog", CATALOG_CACHE_SIZE, CATALOG_CACHE_TTL)
+
+
+def invalidate_categories(*category_ids):
+    catalog_cache.invalidate("categories", "category_tree")
+    invalidate_category_products(*category_ids)
+
+
+def invalidate_category_products(*category_ids):
+    catalog_cache.invalidate(
+        "categories_products", *[f"category:{id}" for id in category_ids]
+    )
+    catalog_cache.invalidate_prefix("facets:")
 
 
 def get_list_of_categories(db: Session):
-    return db.query(Category).all()
+    def load():
+        categories = db.query(Category).all()
+        return [CategoryOut.model_validate(c).model_dump() for c in categories]
+
+    return catalog_cache.get_or_set("categories", load)
 
 
 def get_all_categories_with_products(db: Session):
-    return db.query(Category).options(joinedload(Category.products)).all()
+    def load():
+        categories = (
+            db.query(Category).options(joinedload(Category.products)).all()
+        )
+        apply_prices(db, [product for c in categories for product in c.products])
+        return [
+            CategoryProductsOut.model_validate(c).model_dump() for c in categories
+        ]
+
+    return catalog_cache.get_or_set("categories_products", load)
 
 
 def get_single_category(db: Session, id: int):
-    return (
-        db.query(Category)
-        .filter(Category.id == id)
-        .options(joinedload(Category.products))
-        .one()
+    def load():
+        category = (
+            db.query(Category)
+            .filter(Category.id == id)
+            .options(joinedload(Category.products))
+            .one()
+        )
+        apply_prices(db, category.products)
+        return CategoryProductsOut.model_validate(category).model_dump()
+
+    return catalog_cache.get_or_set(f"category:{id}", load)
+
+
+def get_category_tree(db: Session):
+    def load():
+        categories = db.query(Category).order_by(Category.path).all()
+        nodes = {
+            c.id: {
+                "id": c.id,
+                "name": c.name,
+                "slug": c.slug,
+                "parent_id": c.parent_id,
+                "children": [],
+            }
+            for c in categories
+        }
+        roots = []
+        for c in categories:
+            if c.parent_id in nodes:
+                nodes[c.parent_id]["children"].append(nodes[c.id])
+            else:
+                roots.append(nodes[c.id])
+        return roots
+
+    return catalog_cache.get_or_set("category_tree", load)
+
+
+def rebuild_category_paths(db: Session):
+    db.execute(
+        text(
+            """
+            WITH RECURSIVE tree AS (
+                SELECT id, CAST(id AS TEXT) || '/' AS path
+                FROM category WHERE parent_id IS NULL
+                UNION ALL
+                SELECT category.id, tree.path || category.id || '/'
+                FROM category JOIN tree ON category.parent_id = tree.id
+            )
+            UPDATE category SET path = tree.path
+            FROM tree
+            WHERE category.id = tree.id AND category.path IS DISTINCT FROM tree.path
+            """
+        )
     )
 
 
 def create_category(db: Session, category: CategoryCreate):
     db_category = Category(**category.model_dump())
+    parent_path = ""
+    if db_category.parent_id is not None:
+        parent = db.query(Category).filter(Category.id == db_category.parent_id).first()
+        if not parent:
+            return None
+        parent_path = parent.path
+
     db.add(db_category)
+    db.flush()
+    db_category.path = f"{parent_path}{db_category.id}/"
     db.commit()
     db.refresh(db_category)
+    invalidate_categories()
     return db_category
 
 
@@ -45,11 +161,40 @@ def update_category(db: Session, id: int, category: CategoryUpdate):
     if not db_category:
         return None
 
+    old_path = db_category.path
+    new_path = old_path
+    if category.parent_id != db_category.parent_id:
+        new_path = f"{id}/"
+        if category.parent_id is not None:
+            parent = (
+                db.query(Category).filter(Category.id == category.parent_id).first()
+            )
+            if not parent:
+                return None
+            if parent.path.startswith(old_path):
+                return {"error": "cycle"}
+            new_path = f"{parent.path}{id}/"
+
     for key, value in category.model_dump().items():
         setattr(db_category, key, value)
 
+    if new_path != old_path:
+        db.flush()
+        db.execute(
+            text(
+                """
+                UPDATE category
+                SET path = :new_path || substr(path, length(:old_path) + 1)
+                WHERE path LIKE :old_path || '%'
+                """
+            ),
+            {"new_path": new_path, "old_path": old_path},
+        )
+        db.expire(db_category)
+
     db.commit()
     db.refresh(db_category)
+    invalidate_categories(id)
     return db_category
 
 
@@ -59,68 +204,326 @@ def delete_category(db: Session, id: int):
     if not db_category:
         return None
 
+    if db.query(Category).filter(Category.parent_id == id).first():
+        return {"error": "has_children"}
+
     db.delete(db_category)
     db.commit()
+    invalidate_categories(id)
     return db_category
 
 
-def get_all_products(db: Session):
-    return db.query(Product).options(joinedload(Product.images)).all()
+def encode_cursor(sort: ProductSort, product: Product):
+    value = getattr(product, sort.value)
+    if not isinstance(value, (int, str)):
+        value = str(value) if isinstance(value, Decimal) else value.isoformat()
+    raw = json.dumps([value, product.id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(sort: ProductSort, cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        value, last_id = json.loads(raw)
+        match sort:
+            case ProductSort.price:
+                value = Decimal(value)
+            case ProductSort.created_at:
+                value = datetime.fromisoformat(value)
+            case ProductSort.id:
+                value = int(value)
+            case ProductSort.name:
+                value = str(value)
+        return value, int(last_id)
+    except (binascii.Error, ValueError, TypeError, InvalidOperation):
+        return None
+
 
+def filter_products(query, filters: ProductFilters):
+    if filters.category_id is not None and filters.include_descendants:
+        category_path = (
+            select(Category.path)
+            .where(Category.id == filters.category_id)
+            .scalar_subquery()
+        )
+        query = query.filter(
+            Product.category_id.in_(
+                select(Category.id).where(Category.path.like(category_path + "%"))
+            )
+        )
+    elif filters.category_id is not None:
+        query = query.filter(Product.category_id == filters.category_id)
+    if filters.min_price is not None:
+        query = query.filter(Product.price >= filters.min_price)
+    if filters.max_price is not None:
+        query = query.filter(Product.price <= filters.max_price)
+    if filters.in_stock is not None:
+        query = query.filter(
+            Product.available > 0 if filters.in_stock else Product.available <= 0
+        )
+    if filters.is_active is not None:
+        query = query.filter(Product.is_active == filters.is_active)
+    return query
 
-def get_all_products_from_category(db: Session, category_id):
-    return (
-        db.query(Product)
-        .options(joinedload(Product.images))
-        .filter(Product.category_id == category_id)
-        .all()
+
+def get_all_products(db: Session, filters: ProductFilters):
+    sort_column = SORT_COLUMNS[filters.sort]
+    query = filter_products(
+        db.query(Product).options(selectinload(Product.images)), filters
     )
 
+    if filters.cursor:
+        position = decode_cursor(filters.sort, filters.cursor)
+        if not position:
+            return None
+        key = tuple_(sort_column, Product.id)
+        if filters.order == SortOrder.asc:
+            query = query.filter(key > tuple_(*position))
+        else:
+            query = query.filter(key < tuple_(*position))
+
+    if filters.order == SortOrder.asc:
+        query = query.order_by(sort_column.asc(), Product.id.asc())
+    else:
+        query = query.order_by(sort_column.desc(), Product.id.desc())
+
+    products = query.limit(filters.limit + 1).all()
+
+    next_cursor = None
+    if len(products) > filters.limit:
+        products = products[: filters.limit]
+        next_cursor = encode_cursor(filters.sort, products[-1])
+
+    apply_prices(db, products)
+
+    return {"items": products, "next_cursor": next_cursor}
+
+
+def get_all_products_from_category(
+    db: Session, category_id: int, filters: ProductFilters
+):
+    return get_all_products(
+        db, filters.model_copy(update={"category_id": category_id})
+    )
+
+
+def get_product_facets(db: Session, filters: FacetFilters):
+    def load():
+        filtered = filter_products(
+            select(
+                Product.category_id, Product.price, Product.available.label("stock")
+            ),
+            filters,
+        ).cte("filtered")
+        bounds = select(
+            func.min(filtered.c.price).label("low"),
+            func.max(filtered.c.price).label("high"),
+        ).cte("bounds")
+        high = bounds.c.high + PRICE_BUCKET_STEP
+        rows_source = (
+            select(
+                filtered.c.category_id,
+                filtered.c.price,
+                (filtered.c.stock > 0).label("in_stock"),
+                func.width_bucket(
+                    filtered.c.price, bounds.c.low, high, filters.buckets
+                ).label("bucket"),
+                bounds.c.low,
+                high.label("high"),
+            )
+            .select_from(filtered.join(bounds, true()))
+            .subquery()
+        )
+
+        rows = db.execute(
+            select(
+                func.grouping(
+                    rows_source.c.category_id,
+                    rows_source.c.bucket,
+                    rows_source.c.in_stock,
+                ).label("grouping"),
+                rows_source.c.category_id,
+                rows_source.c.bucket,
+                rows_source.c.in_stock,
+                func.count().label("count"),
+                func.min(rows_source.c.price).label("min_price"),
+                func.max(rows_source.c.price).label("max_price"),
+                func.min(rows_source.c.low).label("low"),
+                func.min(rows_source.c.high).label("high"),
+            ).group_by(
+                func.grouping_sets(
+                    tuple_(rows_source.c.category_id),
+                    tuple_(rows_source.c.bucket),
+                    tuple_(rows_source.c.in_stock),
+                    tuple_(),
+                )
+            )
+        ).all()
+
+        facets = {
+            "total": 0,
+            "categories": [],
+            "price_buckets": [],
+            "stock": {"in_stock": 0, "out_of_stock": 0},
+        }
+        for row in rows:
+            match row.grouping:
+                case 0b011:
+                    facets["categories"].append(
+                        {"category_id": row.category_id, "count": row.count}
+                    )
+                case 0b101:
+                    width = (row.high - row.low) / filters.buckets
+                    facets["price_buckets"].append(
+                        {
+                            "bucket": row.bucket,
+                            "range_from": row.low + width * (row.bucket - 1),
+                            "range_to": row.low + width * row.bucket,
+                            "min_price": row.min_price,
+                            "max_price": row.max_price,
+                            "count": row.count,
+                        }
+                    )
+                case 0b110:
+                    key = "in_stock" if row.in_stock else "out_of_stock"
+                    facets["stock"][key] = row.count
+                case 0b111:
+                    facets["total"] = row.count
+
+        facets["categories"].sort(key=lambda facet: -facet["count"])
+        facets["price_buckets"].sort(key=lambda facet: facet["bucket"])
+        return facets
+
+    return catalog_cache.get_or_set(f"facets:{filters.model_dump_json()}", load)
+
+
+def search_products(db: Session, filters: SearchFilters):
+    ts_query = func.websearch_to_tsquery(SEARCH_CONFIG, filters.q)
+    rank = (
+        func.ts_rank_cd(Product.search_vector, ts_query)
+        + func.similarity(Product.name, filters.q)
+    ).label("rank")
+
+    page = (
+        filter_products(
+            select(Product.id, rank).where(
+                or_(
+                    Product.search_vector.op("@@")(ts_query),
+                    Product.name.op("%")(filters.q),
+                )
+            ),
+            filters,
+        )
+        .order_by(rank.desc(), Product.id)
+        .offset(filters.offset)
+        .limit(filters.limit + 1)
+        .subquery()
+    )
+
+    highlight_options = "StartSel=<mark>, StopSel=</mark>, MaxFragments=2"
+    rows = db.execute(
+        select(
+            Product,
+            page.c.rank,
+            func.ts_headline(
+                SEARCH_CONFIG, Product.name, ts_query, highlight_options
+            ).label("name_highlight"),
+            func.ts_headline(
+                SEARCH_CONFIG, Product.description, ts_query, highlight_options
+            ).label("description_highlight"),
+        )
+        .join(page, page.c.id == Product.id)
+        .options(selectinload(Product.images))
+        .order_by(page.c.rank.desc(), Product.id)
+    ).all()
+
+    next_offset = None
+    if len(rows) > filters.limit:
+        rows = rows[: filters.limit]
+        next_offset = filters.offset + filters.limit
+
+    apply_prices(db, [row.Product for row in rows])
+
+    return {
+        "items": [
+            {
+                "product": row.Product,
+                "rank": row.rank,
+                "name_highlight": row.name_highlight,
+                "description_highlight": row.description_highlight,
+            }
+            for row in rows
+        ],
+        "next_offset": next_offset,
+    }
+
 
 def get_single_product(db: Session, product_id):
-    return (
+    product = (
         db.query(Product)
         .options(joinedload(Product.images))
         .filter(Product.id == product_id)
         .one()
     )
+    apply_prices(db, [product])
+    return product
 
 
 def create_product(db: Session, new_product: ProductCreate):
     db_product = Product(**new_product.model_dump())
+    db_product.lowest_price_30_days = db_product.price
     db.add(db_product)
+    db.flush()
+    record_base_price(db, db_product)
     db.commit()
     db.refresh(db_product)
+    invalidate_category_products(db_product.category_id)
     return db_product
 
 
 def update_product(db: Session, product_id: int, updated_product: ProductUpdate):
-    db_product = db.query(Product).filter(Product.id == product_id).one()
-    if update_product.price < db_product.price:
-        return {"error": "lower_price"}
+    db_product = db.query(Product).filter(Product.id == product_id).first()
     if not db_product:
         return None
+    if updated_product.price < db_product.price:
+        return {"error": "lower_price"}
 
+    price_changed = updated_product.price != db_product.price
+    old_category_id = db_product.category_id
     for key, value in updated_product.model_dump().items():
         setattr(db_product, key, value)
 
+    if price_changed:
+        record_base_price(db, db_product)
+    if db_product.stock_shards:
+        db.flush()
+        rebalance_stock_shards(db, [db_product.id])
+
     db.commit()
     db.refresh(db_product)
+    invalidate_category_products(old_category_id, db_product.category_id)
 
     return db_product
 
 
 def delete_product(db: Session, product_id: int):
-    db_product = db.query(Product).filter(Product.id == product_id).one()
+    db_product = db.query(Product).filter(Product.id == product_id).first()
 
     if not db_product:
         return None
 
     db.delete(db_product)
     db.commit()
+    invalidate_category_products(db_product.category_id)
     return db_product
 
 
+def touch_product(db: Session, product_id: int):
+    db.query(Product).filter(Product.id == product_id).update(
+        {"updated_at": func.now()}, synchronize_session=False
+    )
+
+
 def get_all_product_images_for_product(product_id: int, db: Session):
     return db.query(ProductImage).filter(ProductImage.product_id == product_id).all()
 
@@ -131,14 +534,40 @@ def delete_product_image(id: int, db: Session):
     if not db_image:
         return None
 
-    image_data = {"url": db_image.url}
+    image_data = {
+        "url": db_image.url,
+        "thumbnail_url": db_image.thumbnail_url,
+        "webp_url": db_image.webp_url,
+    }
+    category_id = db_image.product.category_id
 
     db.delete(db_image)
+    touch_product(db, db_image.product_id)
     db.commit()
+
+    image_data["shared"] = (
+        db.query(ProductImage).filter(ProductImage.url == image_data["url"]).first()
+        is not None
+    )
+    invalidate_category_products(category_id)
     return image_data
 
 
 def create_product_image(image: ProductImageCreate, db: Session):
+    if image.content_hash:
+        existing_image = (
+            db.query(ProductImage)
+            .filter(
+                ProductImage.product_id == image.product_id,
+                ProductImage.content_hash == image.content_hash,
+            )
+            .first()
+        )
+        if existing_image:
+            return edit_product_image(
+                db, existing_image.id, ProductImageEdit(is_main=image.is_main)
+            )
+
     if image.is_main:
         db.query(ProductImage).filter(
             ProductImage.product_id == image.product_id
@@ -146,8 +575,10 @@ def create_product_image(image: ProductImageCreate, db: Session):
 
     db_image = ProductImage(**image.model_dump())
     db.add(db_image)
+    touch_product(db, image.product_id)
     db.commit()
     db.refresh(db_image)
+    invalidate_category_products(db_image.product.category_id)
     return db_image
 
 
@@ -163,9 +594,11 @@ def edit_product_image(db: Session, image_id: int, image_data: ProductImageEdit)
         ).update({"is_main": False})
 
     db_image.is_main = image_data.is_main
+    touch_product(db, db_image.product_id)
 
     db.commit()
     db.refresh(db_image)
+    invalidate_category_products(db_image.product.category_id)
     return db_image
 
 
@@ -186,14 +619,26 @@ def add_discount(db: Session, id: int, discount_data: DiscountCreate):
         .first()
     )
 
-    if active_discount and (active_discount.valid_until > discount_data.valid_from):
-        active_discount.valid_until = now()
-
-    discount = Discount(product_id=id, **discount_data.model_dump())
+    if active_discount and (
+        active_discount.valid_until is None
+        or active_discount.valid_until > discount_data.valid_from
+    ):
+        active_discount.valid_until = now
+        record_base_price(db, product)
+
+    discount = Discount(
+        product_id=id,
+        new_price=discount_data.price,
+        valid_from=discount_data.valid_from,
+        valid_until=discount_data.valid_until,
+    )
 
     db.add(discount)
+    record_discount_price(db, product, discount)
+    touch_product(db, id)
     db.commit()
     db.refresh(discount)
+    invalidate_category_products(product.category_id)
 
     return discount
 
@@ -210,9 +655,12 @@ def cancel_discount(db: Session, product_id: int):
         .first()
     )
     if active_discount:
-        active_discount.valid_until = datetime.now()
+        active_discount.valid_until = now
+        record_base_price(db, active_discount.product)
+        touch_product(db, product_id)
         db.commit()
         db.refresh(active_discount)
+        invalidate_category_products(active_discount.product.category_id)
         return active_discount
 
     return None
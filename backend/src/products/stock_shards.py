@@ -0,0 +1,209 @@
+from sqlalchemy import select, insert, update, delete, text
+from sqlalchemy.orm import Session
+from src.products.models import Product, ProductStockShard
+from src.shopping.models import StockReservation
+import random
+
+
+def get_stock_levels(db: Session, product_id: int):
+    product = db.query(Product).filter(Product.id == product_id).first()
+    if not product:
+        return None
+
+    shards = db.scalars(
+        select(ProductStockShard)
+        .where(ProductStockShard.product_id == product_id)
+        .order_by(ProductStockShard.shard)
+    ).all()
+    reserved = (
+        sum(shard.reserved for shard in shards)
+        if product.stock_shards
+        else product.reserved
+    )
+    return {
+        "product_id": product.id,
+        "stock": product.stock,
+        "reserved": reserved,
+        "available": product.stock - reserved,
+        "stock_shards": product.stock_shards,
+        "shards": shards,
+    }
+
+
+def set_stock_shards(db: Session, product_id: int, shards: int):
+    product = (
+        db.query(Product)
+        .filter(Product.id == product_id)
+        .with_for_update(key_share=True)
+        .first()
+    )
+    if not product:
+        return None
+
+    if product.stock_shards:
+        locked = db.scalars(
+            select(ProductStockShard)
+            .where(ProductStockShard.product_id == product_id)
+            .order_by(ProductStockShard.shard)
+            .with_for_update(key_share=True)
+        ).all()
+        product.reserved = sum(shard.reserved for shard in locked)
+        db.execute(
+            update(StockReservation)
+            .where(StockReservation.product_id == product_id)
+            .values(shard=None)
+        )
+        db.execute(
+            delete(ProductStockShard).where(ProductStockShard.product_id == product_id)
+        )
+
+    product.stock_shards = shards
+    if shards:
+        db.execute(
+            insert(ProductStockShard),
+            [
+                {
+                    "product_id": product_id,
+                    "shard": shard,
+                    "allocated": 0,
+                    "reserved": product.reserved if shard == 0 else 0,
+                }
+                for shard in range(shards)
+            ],
+        )
+        db.execute(
+            update(StockReservation)
+            .where(StockReservation.product_id == product_id)
+            .values(shard=0)
+        )
+        db.flush()
+        rebalance_stock_shards(db, [product_id])
+
+    db.commit()
+    return get_stock_levels(db, product_id)
+
+
+def rebalance_all_stock_shards(db: Session):
+    rebalanced = rebalance_stock_shards(db)
+    db.commit()
+    return rebalanced
+
+
+def rebalance_stock_shards(db: Session, product_ids=None):
+    query = select(Product.id).where(Product.stock_shards > 0)
+    if product_ids is not None:
+        query = query.where(Product.id.in_(product_ids))
+    product_ids = db.scalars(
+        query.order_by(Product.id).with_for_update(key_share=True)
+    ).all()
+    if not product_ids:
+        return 0
+
+    # Take every lock before reading stock, so the statement below runs on a
+    # snapshot that already includes payments committed while we waited.
+    db.execute(
+        text(
+            """
+            SELECT 1 FROM product_stock_shard
+            WHERE product_id = ANY(:ids)
+            ORDER BY product_id, shard
+            FOR NO KEY UPDATE
+            """
+        ),
+        {"ids": list(product_ids)},
+    )
+    db.execute(
+        text(
+            """
+            WITH locked AS (
+                SELECT product_id, shard, reserved FROM product_stock_shard
+                WHERE product_id = ANY(:ids)
+            ),
+            totals AS (
+                SELECT locked.product_id, SUM(locked.reserved) AS reserved,
+                       COUNT(*) AS shards,
+                       GREATEST(product.stock - SUM(locked.reserved), 0) AS free
+                FROM locked JOIN product ON product.id = locked.product_id
+                GROUP BY locked.product_id, product.stock
+            ),
+            consolidated AS (
+                UPDATE product SET reserved = totals.reserved, updated_at = now()
+                FROM totals
+                WHERE product.id = totals.product_id
+                  AND product.reserved <> totals.reserved
+            )
+            UPDATE product_stock_shard SET allocated = locked.reserved
+                + totals.free / totals.shards
+                + CASE WHEN locked.shard < totals.free % totals.shards THEN 1 ELSE 0 END,
+                updated_at = now()
+            FROM locked JOIN totals ON totals.product_id = locked.product_id
+            WHERE product_stock_shard.product_id = locked.product_id
+              AND product_stock_shard.shard = locked.shard
+            """
+        ),
+        {"ids": list(product_ids)},
+    )
+    return len(product_ids)
+
+
+def claim_shard_stock(db: Session, product_id: int, shards: int, quantity: int):
+    # A miss can still leave the shard it waited on locked; roll it back so the
+    # fallback below takes its locks in shard order.
+    savepoint = db.begin_nested()
+    claimed = db.execute(
+        text(
+            """
+            UPDATE product_stock_shard
+            SET reserved = reserved + :quantity, updated_at = now()
+            WHERE product_id = :product_id
+              AND allocated - reserved >= :quantity
+              AND shard = (
+                SELECT shard FROM product_stock_shard
+                WHERE product_id = :product_id AND allocated - reserved >= :quantity
+                ORDER BY (shard - :start + :shards) % :shards
+                LIMIT 1
+              )
+            RETURNING shard
+            """
+        ),
+        {
+            "product_id": product_id,
+            "quantity": quantity,
+            "start": random.randrange(shards),
+            "shards": shards,
+        },
+    ).scalars().all()
+    if claimed:
+        savepoint.commit()
+        return [(shard, quantity) for shard in claimed]
+    savepoint.rollback()
+
+    claimed = db.execute(
+        text(
+            """
+            WITH locked AS (
+                SELECT shard, allocated - reserved AS free FROM product_stock_shard
+                WHERE product_id = :product_id
+                ORDER BY shard
+                FOR NO KEY UPDATE
+            ),
+            taken AS (
+                SELECT shard, LEAST(free, :quantity - COALESCE(SUM(free) OVER (
+                    ORDER BY shard ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING
+                ), 0)) AS quantity
+                FROM locked WHERE free > 0
+            )
+            UPDATE product_stock_shard
+            SET reserved = product_stock_shard.reserved + taken.quantity,
+                updated_at = now()
+            FROM taken
+            WHERE product_stock_shard.product_id = :product_id
+              AND product_stock_shard.shard = taken.shard
+              AND taken.quantity > 0
+              AND (SELECT SUM(free) FROM locked WHERE free > 0) >= :quantity
+            RETURNING product_stock_shard.shard, taken.quantity
+            """
+        ),
+        {"product_id": product_id, "quantity": quantity},
+    ).all()
+    return claimed or None
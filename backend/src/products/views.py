@@ -0,0 +1,58 @@
+from collections import Counter
+from threading import Lock
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from src.products.constants import VIEW_FLUSH_BATCH_SIZE
+from src.products.popularity import record_views_popularity
+
+_pending_views = Counter()
+_lock = Lock()
+
+
+def record_view(product_id: int, count: int = 1):
+    with _lock:
+        _pending_views[product_id] += count
+
+
+def drain_views():
+    global _pending_views
+    with _lock:
+        drained, _pending_views = _pending_views, Counter()
+    return drained
+
+
+def flush_views(db: Session):
+    views = drain_views()
+    if not views:
+        return views
+
+    items = list(views.items())
+    try:
+        for start in range(0, len(items), VIEW_FLUSH_BATCH_SIZE):
+            chunk = items[start : start + VIEW_FLUSH_BATCH_SIZE]
+            params = {}
+            values = []
+            for i, (product_id, count) in enumerate(chunk):
+                params[f"id_{i}"] = product_id
+                params[f"count_{i}"] = count
+                values.append(f"(:id_{i}, :count_{i})")
+
+            db.execute(
+                text(
+                    f"""
+                    UPDATE product SET views = COALESCE(product.views, 0) + v.count
+                    FROM (VALUES {", ".join(values)}) AS v(id, count)
+                    WHERE product.id = v.id
+                    """
+                ),
+                params,
+            )
+            record_views_popularity(db, dict(chunk))
+        db.commit()
+    except Exception:
+        db.rollback()
+        for product_id, count in items:
+            record_view(product_id, count)
+        raise
+
+    return views
@@ -0,0 +1,8 @@
+import os
+
+RELATED_PRODUCTS_LIMIT = 10
+RECOMMENDATION_ORDER_BATCH = 5000
+COOCCURRENCE_UPSERT_BATCH = 1000
+RECOMMENDATION_LOOKBACK_HOURS = 24
+RELATED_CACHE_SIZE = int(os.getenv("RELATED_CACHE_SIZE", "2048"))
+RELATED_CACHE_TTL = int(os.getenv("RELATED_CACHE_TTL", "3600"))
@@ -0,0 +1,39 @@
+from sqlalchemy import Column, Integer, ForeignKey, DateTime, Index, text
+from src.database import Base
+
+
+class ProductCooccurrence(Base):
+    __tablename__ = "product_cooccurrence"
+
+    product_id = Column(
+        Integer, ForeignKey("product.id", ondelete="CASCADE"), primary_key=True
+    )
+    related_product_id = Column(
+        Integer, ForeignKey("product.id", ondelete="CASCADE"), primary_key=True
+    )
+    count = Column(Integer, nullable=False, default=0)
+
+
+class RelatedProduct(Base):
+    __tablename__ = "related_product"
+    __table_args__ = (
+        Index("ix_related_product_product_id_rank", "product_id", "rank"),
+    )
+
+    product_id = Column(
+        Integer, ForeignKey("product.id", ondelete="CASCADE"), primary_key=True
+    )
+    related_product_id = Column(
+        Integer, ForeignKey("product.id", ondelete="CASCADE"), primary_key=True
+    )
+    score = Column(Integer, nullable=False)
+    rank = Column(Integer, nullable=False)
+
+
+class ProcessedOrder(Base):
+    __tablename__ = "recommendation_processed_order"
+
+    order_id = Column(
+        Integer, ForeignKey("order.id", ondelete="CASCADE"), primary_key=True
+    )
+    processed_at = Column(DateTime, nullable=False, server_default=text("now()"))
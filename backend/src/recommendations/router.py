@@ -0,0 +1,13 @@
+from fastapi import APIRouter, Depends
+from sqlalchemy.orm import Session
+from src.dependencies import get_read_db
+from src.products.schemas import ProductOut
+from src.recommendations.service import get_related_products
+from typing import List
+
+router = APIRouter(prefix="/shop", tags=["recommendations"])
+
+
+@router.get("/product/{product_id}/related", response_model=List[ProductOut])
+def get_related(product_id: int, db: Session = Depends(get_read_db)):
+    return get_related_products(db, product_id)
@@ -0,0 +1,157 @@
+from sqlalchemy import select, func, text, exists
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy.dialects.postgresql import insert
+from scipy import sparse
+from datetime import timedelta
+from src.cache import TTLCache
+from src.shopping.models import Order, OrderItem
+from src.shopping.constants import OrderStatus
+from src.products.models import Product
+from src.products.pricing import apply_prices
+from src.recommendations.models import (
+    ProductCooccurrence,
+    RelatedProduct,
+    ProcessedOrder,
+)
+from src.recommendations.constants import (
+    RELATED_PRODUCTS_LIMIT,
+    RECOMMENDATION_ORDER_BATCH,
+    COOCCURRENCE_UPSERT_BATCH,
+    RECOMMENDATION_LOOKBACK_HOURS,
+    RELATED_CACHE_SIZE,
+    RELATED_CACHE_TTL,
+)
+import numpy as np
+
+related_cache = TTLCache("related", RELATED_CACHE_SIZE, RELATED_CACHE_TTL)
+
+
+def get_related_products(db: Session, product_id: int):
+    def load():
+        return db.scalars(
+            select(RelatedProduct.related_product_id)
+            .where(RelatedProduct.product_id == product_id)
+            .order_by(RelatedProduct.rank)
+        ).all()
+
+    related_ids = related_cache.get_or_set(product_id, load)
+    if not related_ids:
+        return []
+
+    products = {
+        product.id: product
+        for product in db.query(Product)
+        .options(selectinload(Product.images))
+        .filter(Product.id.in_(related_ids), Product.is_active == True)
+        .all()
+    }
+    apply_prices(db, products.values())
+    return [products[id] for id in related_ids if id in products]
+
+
+def get_new_orders(db: Session, last_processed):
+    query = select(Order.id).where(
+        Order.status.in_([OrderStatus.paid, OrderStatus.shipped]),
+        ~exists().where(ProcessedOrder.order_id == Order.id),
+    )
+    if last_processed is not None:
+        query = query.where(
+            Order.updated_at
+            > last_processed - timedelta(hours=RECOMMENDATION_LOOKBACK_HOURS)
+        )
+
+    return db.scalars(query.order_by(Order.id).limit(RECOMMENDATION_ORDER_BATCH)).all()
+
+
+def count_cooccurrences(order_items):
+    orders, order_index = np.unique(
+        np.array([order_id for order_id, _ in order_items]), return_inverse=True
+    )
+    products, product_index = np.unique(
+        np.array([product_id for _, product_id in order_items]), return_inverse=True
+    )
+
+    baskets = sparse.csr_matrix(
+        (np.ones(len(order_items), dtype=np.int32), (order_index, product_index)),
+        shape=(len(orders), len(products)),
+    )
+    baskets.data[:] = 1
+
+    pairs = (baskets.T @ baskets).tocoo()
+    mask = pairs.row != pairs.col
+    return [
+        {
+            "product_id": int(products[row]),
+            "related_product_id": int(products[col]),
+            "count": int(count),
+        }
+        for row, col, count in zip(
+            pairs.row[mask], pairs.col[mask], pairs.data[mask]
+        )
+    ]
+
+
+def refresh_related_products(db: Session, product_ids):
+    db.execute(
+        RelatedProduct.__table__.delete().where(
+            RelatedProduct.product_id.in_(product_ids)
+        )
+    )
+    db.execute(
+        text(
+            """
+            INSERT INTO related_product (product_id, related_product_id, score, rank)
+            SELECT product_id, related_product_id, count, rank FROM (
+                SELECT product_id, related_product_id, count, row_number() OVER (
+                    PARTITION BY product_id
+                    ORDER BY count DESC, related_product_id
+                ) AS rank
+                FROM product_cooccurrence
+                WHERE product_id = ANY(:ids)
+            ) ranked
+            WHERE rank <= :limit
+            """
+        ),
+        {"ids": list(product_ids), "limit": RELATED_PRODUCTS_LIMIT},
+    )
+
+
+def update_recommendations(db: Session):
+    processed = 0
+    last_processed = db.scalar(select(func.max(ProcessedOrder.processed_at)))
+    while order_ids := get_new_orders(db, last_processed):
+        order_items = db.execute(
+            select(OrderItem.order_id, OrderItem.product_id)
+            .where(OrderItem.order_id.in_(order_ids))
+            .distinct()
+        ).all()
+
+        product_ids = set()
+        if order_items:
+            pairs = count_cooccurrences(order_items)
+            for start in range(0, len(pairs), COOCCURRENCE_UPSERT_BATCH):
+                chunk = pairs[start : start + COOCCURRENCE_UPSERT_BATCH]
+                statement = insert(ProductCooccurrence).values(chunk)
+                db.execute(
+                    statement.on_conflict_do_update(
+                        index_elements=["product_id", "related_product_id"],
+                        set_={
+                            "count": ProductCooccurrence.count
+                            + statement.excluded.count
+                        },
+                    )
+                )
+            product_ids = {pair["product_id"] for pair in pairs}
+            if product_ids:
+                refresh_related_products(db, product_ids)
+
+        db.execute(
+            insert(ProcessedOrder).values(
+                [{"order_id": order_id} for order_id in order_ids]
+            )
+        )
+        db.commit()
+        related_cache.invalidate(*product_ids)
+        processed += len(order_ids)
+
+    return processed
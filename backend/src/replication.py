@@ -0,0 +1,65 @@
+from contextvars import ContextVar
+from fastapi import Request
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+from src.database import engine, SessionLocal, REPLICA_DATABASE_URL
+import os
+import re
+
+LSN_COOKIE = "db_lsn"
+READ_YOUR_WRITES_SECONDS = int(os.getenv("READ_YOUR_WRITES_SECONDS", "60"))
+LSN_PATTERN = re.compile(r"^[0-9A-F]{1,8}/[0-9A-F]{1,8}$")
+
+_request_writes = ContextVar("request_writes", default=None)
+
+
+def mark_write(session: Session):
+    if _request_writes.get() is None:
+        return
+    wrote = session.execute(text("SELECT pg_current_xact_id_if_assigned()")).scalar()
+    if wrote is not None:
+        session.info["wrote"] = True
+
+
+def remember_commit_lsn(session: Session):
+    writes = _request_writes.get()
+    if writes is None or not session.info.pop("wrote", False):
+        return
+    with engine.connect() as connection:
+        writes["lsn"] = connection.execute(text("SELECT pg_current_wal_lsn()")).scalar()
+
+
+def replica_has_replayed(db: Session, lsn: str):
+    if not LSN_PATTERN.match(lsn):
+        return False
+    return db.execute(
+        text(
+            "SELECT NOT pg_is_in_recovery() "
+            "OR pg_last_wal_replay_lsn() >= CAST(:lsn AS pg_lsn)"
+        ),
+        {"lsn": lsn},
+    ).scalar()
+
+
+async def read_your_writes(request: Request, call_next):
+    writes = {}
+    token = _request_writes.set(writes)
+    try:
+        response = await call_next(request)
+    finally:
+        _request_writes.reset(token)
+
+    if writes.get("lsn"):
+        response.set_cookie(
+            LSN_COOKIE,
+            writes["lsn"],
+            max_age=READ_YOUR_WRITES_SECONDS,
+            httponly=True,
+            samesite="lax",
+        )
+    return response
+
+
+if REPLICA_DATABASE_URL:
+    event.listen(SessionLocal, "before_commit", mark_write)
+    event.listen(SessionLocal, "after_commit", remember_commit_lsn)
@@ -0,0 +1,221 @@
+from collections import OrderedDict
+from threading import Lock
+from sqlalchemy import select, text, or_
+from sqlalchemy.orm import Session
+from sqlalchemy.dialects.postgresql import insert
+from src.shopping.models import Cart, CartItem
+from src.shopping.constants import (
+    CartStoreBackend,
+    CART_STORE,
+    CART_STORE_URL,
+    CART_STORE_TTL,
+    CART_STORE_MAX_CARTS,
+    CART_FLUSH_BATCH_SIZE,
+)
+import json
+
+
+class MemoryCartStore:
+    def __init__(self, max_carts: int):
+        self.max_carts = max_carts
+        self._carts = OrderedDict()
+        self._dirty = set()
+        self._lock = Lock()
+
+    def get(self, key):
+        with self._lock:
+            raw = self._carts.get(key)
+            if raw is None:
+                return None
+            self._carts.move_to_end(key)
+        return json.loads(raw)
+
+    def set(self, key, cart, dirty: bool = True):
+        raw = json.dumps(cart)
+        with self._lock:
+            self._carts[key] = raw
+            self._carts.move_to_end(key)
+            if dirty:
+                self._dirty.add(key)
+            self._evict()
+
+    def delete(self, key):
+        with self._lock:
+            self._carts.pop(key, None)
+            self._dirty.discard(key)
+
+    def mark_dirty(self, keys):
+        with self._lock:
+            self._dirty.update(key for key in keys if key in self._carts)
+
+    def drain_dirty(self, limit: int):
+        with self._lock:
+            drained = [self._dirty.pop() for _ in range(min(limit, len(self._dirty)))]
+        return drained
+
+    def _evict(self):
+        overflow = len(self._carts) - self.max_carts
+        if overflow <= 0:
+            return
+        evicted = []
+        for key in self._carts:
+            if key not in self._dirty:
+                evicted.append(key)
+                if len(evicted) == overflow:
+                    break
+        for key in evicted:
+            del self._carts[key]
+
+
+class RedisCartStore:
+    DIRTY_KEY = "cart:dirty"
+
+    def __init__(self, url: str, ttl: int):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+
+    def get(self, key):
+        raw = self.client.get(f"cart:{key}")
+        return json.loads(raw) if raw is not None else None
+
+    def set(self, key, cart, dirty: bool = True):
+        pipeline = self.client.pipeline()
+        pipeline.set(f"cart:{key}", json.dumps(cart), ex=self.ttl)
+        if dirty:
+            pipeline.sadd(self.DIRTY_KEY, key)
+        pipeline.execute()
+
+    def delete(self, key):
+        pipeline = self.client.pipeline()
+        pipeline.delete(f"cart:{key}")
+        pipeline.srem(self.DIRTY_KEY, key)
+        pipeline.execute()
+
+    def mark_dirty(self, keys):
+        if keys:
+            self.client.sadd(self.DIRTY_KEY, *keys)
+
+    def drain_dirty(self, limit: int):
+        return [key.decode() for key in self.client.spop(self.DIRTY_KEY, limit)]
+
+
+def create_cart_store(backend: CartStoreBackend):
+    if backend == CartStoreBackend.memory:
+        return MemoryCartStore(CART_STORE_MAX_CARTS)
+    if backend == CartStoreBackend.redis:
+        return RedisCartStore(CART_STORE_URL, CART_STORE_TTL)
+    return None
+
+
+cart_store = create_cart_store(CART_STORE)
+
+
+def cart_key(user_id, guest_cart_id=None):
+    if user_id is not None:
+        return f"user:{user_id}"
+    return f"guest:{guest_cart_id}"
+
+
+def cart_state(cart):
+    return {
+        "id": cart.id,
+        "items": [
+            {
+                "id": item.id,
+                "product_id": item.product_id,
+                "quantity": item.quantity,
+                "price_at_time": str(item.price_at_time),
+            }
+            for item in cart.items
+        ],
+    }
+
+
+def write_carts(db: Session, carts):
+    item_cart_ids = []
+    item_product_ids = []
+    rows = []
+    for cart in carts:
+        for item in cart["items"]:
+            item_cart_ids.append(cart["id"])
+            item_product_ids.append(item["product_id"])
+            rows.append(
+                {
+                    "cart_id": cart["id"],
+                    "product_id": item["product_id"],
+                    "quantity": item["quantity"],
+                    "price_at_time": item["price_at_time"],
+                }
+            )
+
+    db.execute(
+        text(
+            """
+            DELETE FROM cart_item
+            WHERE cart_id = ANY(:cart_ids)
+              AND (cart_id, product_id) NOT IN (
+                SELECT * FROM unnest(
+                    CAST(:item_cart_ids AS integer[]),
+                    CAST(:item_product_ids AS integer[])
+                )
+              )
+            """
+        ),
+        {
+            "cart_ids": [cart["id"] for cart in carts],
+            "item_cart_ids": item_cart_ids,
+            "item_product_ids": item_product_ids,
+        },
+    )
+    if not rows:
+        return {}
+
+    statement = insert(CartItem).values(rows)
+    written = db.execute(
+        statement.on_conflict_do_update(
+            index_elements=["cart_id", "product_id"],
+            set_={
+                "quantity": statement.excluded.quantity,
+                "price_at_time": statement.excluded.price_at_time,
+            },
+            where=or_(
+                CartItem.quantity != statement.excluded.quantity,
+                CartItem.price_at_time != statement.excluded.price_at_time,
+            ),
+        ).returning(CartItem.id, CartItem.cart_id, CartItem.product_id)
+    ).all()
+    return {(row.cart_id, row.product_id): row.id for row in written}
+
+
+def flush_carts(db: Session):
+    if not cart_store:
+        return 0
+
+    flushed = 0
+    while keys := cart_store.drain_dirty(CART_FLUSH_BATCH_SIZE):
+        carts = [cart for cart in map(cart_store.get, keys) if cart is not None]
+        try:
+            locked = set(
+                db.scalars(
+                    select(Cart.id)
+                    .where(Cart.id.in_([cart["id"] for cart in carts]))
+                    .order_by(Cart.id)
+                    .with_for_update()
+                )
+            )
+            carts = [
+                cart
+                for cart in map(cart_store.get, keys)
+                if cart is not None and cart["id"] in locked
+            ]
+            if carts:
+                write_carts(db, carts)
+            db.commit()
+        except Exception:
+            db.rollback()
+            cart_store.mark_dirty(keys)
+            raise
+        flushed += len(carts)
+    return flushed
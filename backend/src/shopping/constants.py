@@ -1,4 +1,5 @@
 from enum import Enum as pyEnum
+import os
 
 
 class OrderStatus(pyEnum):
@@ -6,3 +7,42 @@ class OrderStatus(pyEnum):
     paid = "paid"
     shipped = "shipped"
     cancelled = "cancelled"
+
+
+class CartOperationType(pyEnum):
+    add = "add"
+    set = "set"
+    remove = "remove"
+
+
+class CartStoreBackend(pyEnum):
+    database = "database"
+    memory = "memory"
+    redis = "redis"
+
+
+class IdempotencyScope(pyEnum):
+    order = "order"
+    guest_order = "guest_order"
+
+
+RESERVATION_TTL_MINUTES = int(os.getenv("RESERVATION_TTL_MINUTES", "15"))
+# Stripe rejects checkout sessions expiring less than 30 minutes from creation.
+CHECKOUT_SESSION_TTL_MINUTES = 32
+RESERVATION_SWEEP_INTERVAL = int(os.getenv("RESERVATION_SWEEP_INTERVAL", "5"))
+ORDER_SWEEP_BATCH_SIZE = int(os.getenv("ORDER_SWEEP_BATCH_SIZE", "200"))
+
+IDEMPOTENCY_KEY_TTL_HOURS = int(os.getenv("IDEMPOTENCY_KEY_TTL_HOURS", "24"))
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+
+MAX_CART_OPERATIONS = 100
+
+CART_STORE = CartStoreBackend(os.getenv("CART_STORE", "database"))
+CART_STORE_URL = os.getenv("CART_STORE_URL", "redis://localhost:6379/0")
+CART_STORE_TTL = int(os.getenv("CART_STORE_TTL", "86400"))
+CART_STORE_MAX_CARTS = int(os.getenv("CART_STORE_MAX_CARTS", "100000"))
+CART_FLUSH_INTERVAL = int(os.getenv("CART_FLUSH_INTERVAL", "5"))
+CART_FLUSH_BATCH_SIZE = 500
+
+GUEST_CART_TTL_DAYS = int(os.getenv("GUEST_CART_TTL_DAYS", "30"))
+GUEST_CART_COOKIE = "cart_token"
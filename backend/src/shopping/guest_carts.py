@@ -0,0 +1,152 @@
+from fastapi import Request, Response
+from sqlalchemy import text, select, update, delete, or_, and_
+from sqlalchemy.orm import Session
+from datetime import datetime, timedelta
+from jwt.exceptions import InvalidTokenError
+from src.auth.token import SECRET_KEY, ALGORITHM
+from src.shopping.models import Cart
+from src.shopping.constants import GUEST_CART_TTL_DAYS, GUEST_CART_COOKIE
+from src.shopping.cart_store import cart_store, cart_key, write_carts
+from typing import Optional
+import jwt
+
+
+def create_cart_token(cart_id: int, expires_at: datetime):
+    return jwt.encode(
+        {"cart": cart_id, "exp": int(expires_at.timestamp())},
+        SECRET_KEY,
+        algorithm=ALGORITHM,
+    )
+
+
+def read_cart_token(token: Optional[str]):
+    if not token:
+        return None
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except InvalidTokenError:
+        return None
+    cart_id = payload.get("cart")
+    return cart_id if isinstance(cart_id, int) else None
+
+
+def get_guest_cart_id(request: Request) -> Optional[int]:
+    return read_cart_token(request.cookies.get(GUEST_CART_COOKIE))
+
+
+def create_guest_cart(db: Session, response: Response):
+    expires_at = datetime.now() + timedelta(days=GUEST_CART_TTL_DAYS)
+    cart = Cart(expires_at=expires_at)
+    db.add(cart)
+    db.commit()
+    db.refresh(cart)
+
+    if cart_store:
+        cart_store.set(cart_key(None, cart.id), {"id": cart.id, "items": []}, dirty=False)
+    response.set_cookie(
+        GUEST_CART_COOKIE,
+        create_cart_token(cart.id, expires_at),
+        max_age=GUEST_CART_TTL_DAYS * 24 * 60 * 60,
+        httponly=True,
+        samesite="lax",
+    )
+    return cart
+
+
+def merge_guest_cart(db: Session, guest_cart_id: int, user_id: int):
+    owners = dict(
+        db.execute(
+            select(Cart.id, Cart.user_id)
+            .where(
+                or_(
+                    and_(
+                        Cart.id == guest_cart_id,
+                        Cart.user_id.is_(None),
+                        Cart.expires_at > datetime.now(),
+                    ),
+                    Cart.user_id == user_id,
+                )
+            )
+            .order_by(Cart.id)
+            .with_for_update()
+        ).all()
+    )
+    if guest_cart_id not in owners:
+        return None
+    user_cart = next(
+        (cart_id for cart_id, owner in owners.items() if owner == user_id), None
+    )
+
+    cached = {}
+    if cart_store:
+        for key in [cart_key(user_id), cart_key(None, guest_cart_id)]:
+            cart = cart_store.get(key)
+            if cart is not None:
+                cached[key] = cart
+        if cached:
+            write_carts(db, list(cached.values()))
+
+    if not user_cart:
+        db.execute(
+            update(Cart)
+            .where(Cart.id == guest_cart_id)
+            .values(user_id=user_id, expires_at=None)
+        )
+        user_cart = guest_cart_id
+    else:
+        db.execute(
+            text(
+                """
+                WITH moved AS (
+                    DELETE FROM cart_item WHERE cart_id = :guest_cart_id
+                    RETURNING product_id, quantity, price_at_time
+                )
+                INSERT INTO cart_item (cart_id, product_id, quantity, price_at_time)
+                SELECT :user_cart_id, product_id, quantity, price_at_time FROM moved
+                ON CONFLICT (cart_id, product_id) DO UPDATE
+                SET quantity = GREATEST(cart_item.quantity, EXCLUDED.quantity),
+                    price_at_time = EXCLUDED.price_at_time
+                """
+            ),
+            {"guest_cart_id": guest_cart_id, "user_cart_id": user_cart},
+        )
+        db.execute(delete(Cart).where(Cart.id == guest_cart_id))
+
+    if cart_store:
+        cart_store.delete(cart_key(user_id))
+        cart_store.delete(cart_key(None, guest_cart_id))
+    try:
+        db.commit()
+    except Exception:
+        for key, cart in cached.items():
+            cart_store.set(key, cart)
+        raise
+    return user_cart
+
+
+def delete_expired_guest_carts(db: Session):
+    cart_ids = db.scalars(
+        text(
+            """
+            WITH expired AS (
+                SELECT id FROM cart
+                WHERE user_id IS NULL AND expires_at < :now
+                FOR UPDATE SKIP LOCKED
+            ),
+            items AS (
+                DELETE FROM cart_item USING expired
+                WHERE cart_item.cart_id = expired.id
+            )
+            DELETE FROM cart USING expired
+            WHERE cart.id = expired.id
+            RETURNING cart.id
+            """
+        ),
+        {"now": datetime.now()},
+    ).all()
+    db.commit()
+
+    if cart_store:
+        for cart_id in cart_ids:
+            cart_store.delete(cart_key(None, cart_id))
+    return len(cart_ids)
@@ -0,0 +1,68 @@
+from sqlalchemy import select, update, delete, func
+from sqlalchemy.orm import Session
+from sqlalchemy.dialects.postgresql import insert
+from datetime import datetime, timedelta
+from src.shopping.models import IdempotencyKey
+from src.shopping.constants import IdempotencyScope, IDEMPOTENCY_KEY_TTL_HOURS
+import hashlib
+
+
+def fingerprint(payload: str):
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def claim_idempotency_key(
+    db: Session,
+    scope: IdempotencyScope,
+    owner: str,
+    key: str,
+    request_fingerprint: str,
+):
+    statement = insert(IdempotencyKey).values(
+        scope=scope,
+        owner=owner,
+        key=key,
+        fingerprint=request_fingerprint,
+        expires_at=datetime.now() + timedelta(hours=IDEMPOTENCY_KEY_TTL_HOURS),
+    )
+    key_id = db.scalar(
+        statement.on_conflict_do_update(
+            index_elements=["scope", "owner", "key"],
+            set_={
+                "fingerprint": statement.excluded.fingerprint,
+                "expires_at": statement.excluded.expires_at,
+                "order_id": None,
+                "created_at": func.now(),
+            },
+            where=IdempotencyKey.expires_at <= func.now(),
+        ).returning(IdempotencyKey.id)
+    )
+    if key_id:
+        return key_id, None
+
+    stored = db.scalars(
+        select(IdempotencyKey).where(
+            IdempotencyKey.scope == scope,
+            IdempotencyKey.owner == owner,
+            IdempotencyKey.key == key,
+        )
+    ).first()
+    if not stored or stored.fingerprint != request_fingerprint:
+        return None, {"error": "idempotency_key_reused"}
+    return None, stored
+
+
+def complete_idempotency_key(db: Session, key_id: int, order_id: int):
+    db.execute(
+        update(IdempotencyKey)
+        .where(IdempotencyKey.id == key_id)
+        .values(order_id=order_id)
+    )
+
+
+def delete_expired_idempotency_keys(db: Session):
+    deleted = db.execute(
+        delete(IdempotencyKey).where(IdempotencyKey.expires_at < func.now())
+    ).rowcount
+    db.commit()
+    return deleted
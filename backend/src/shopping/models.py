@@ -7,17 +7,27 @@ from sqlalchemy import (
     DateTime,
     Numeric,
     Enum,
+    Index,
+    UniqueConstraint,
 )
 from sqlalchemy.orm import relationship
-from src.shopping.constants import OrderStatus
+from src.shopping.constants import OrderStatus, IdempotencyScope
 from src.database import Base
 
 
 class Cart(Base):
     __tablename__ = "cart"
+    __table_args__ = (
+        Index(
+            "ix_cart_guest_expires_at",
+            "expires_at",
+            postgresql_where=text("user_id IS NULL"),
+        ),
+    )
 
     id = Column(Integer, primary_key=True)
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    expires_at = Column(DateTime, nullable=True)
     created_at = Column(DateTime, nullable=False, server_default=text("now()"))
     updated_at = Column(
         DateTime, nullable=False, server_default=text("now()"), onupdate=text("now()")
@@ -31,6 +41,7 @@ class Cart(Base):
 
 class CartItem(Base):
     __tablename__ = "cart_item"
+    __table_args__ = (UniqueConstraint("cart_id", "product_id"),)
 
     id = Column(Integer, primary_key=True)
     cart_id = Column(Integer, ForeignKey("cart.id"), nullable=False)
@@ -44,6 +55,7 @@ class CartItem(Base):
 
 class Order(Base):
     __tablename__ = "order"
+    __table_args__ = (Index("ix_order_updated_at", "updated_at"),)
 
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
@@ -67,6 +79,7 @@ class Order(Base):
 
 class OrderItem(Base):
     __tablename__ = "order_item"
+    __table_args__ = (Index("ix_order_item_order_id", "order_id"),)
 
     id = Column(Integer, primary_key=True)
     order_id = Column(Integer, ForeignKey("order.id"), nullable=True)
@@ -77,3 +90,42 @@ class OrderItem(Base):
 
     order = relationship("Order", back_populates="items")
     product = relationship("Product")
+
+
+class StockReservation(Base):
+    __tablename__ = "stock_reservation"
+    __table_args__ = (
+        Index("ix_stock_reservation_expires_at", "expires_at"),
+        Index("ix_stock_reservation_order_id", "order_id"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    product_id = Column(
+        Integer, ForeignKey("product.id", ondelete="CASCADE"), nullable=False
+    )
+    order_id = Column(
+        Integer, ForeignKey("order.id", ondelete="CASCADE"), nullable=False
+    )
+    shard = Column(Integer, nullable=True)
+    quantity = Column(Integer, nullable=False)
+    expires_at = Column(DateTime, nullable=False)
+    created_at = Column(DateTime, nullable=False, server_default=text("now()"))
+
+
+class IdempotencyKey(Base):
+    __tablename__ = "idempotency_key"
+    __table_args__ = (
+        UniqueConstraint("scope", "owner", "key"),
+        Index("ix_idempotency_key_expires_at", "expires_at"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    scope = Column(Enum(IdempotencyScope), nullable=False)
+    owner = Column(String(255), nullable=False)
+    key = Column(String(255), nullable=False)
+    fingerprint = Column(String(64), nullable=False)
+    order_id = Column(
+        Integer, ForeignKey("order.id", ondelete="CASCADE"), nullable=True
+    )
+    created_at = Column(DateTime, nullable=False, server_default=text("now()"))
+    expires_at = Column(DateTime, nullable=False)
@@ -0,0 +1,246 @@
+from sqlalchemy import insert, update, text, func
+from sqlalchemy.orm import Session
+from datetime import datetime, timedelta
+from src.shopping.models import StockReservation, OrderItem
+from src.products.models import Product
+from src.shopping.constants import RESERVATION_TTL_MINUTES
+from src.products.stock_shards import claim_shard_stock
+
+
+def reserve_stock(db: Session, order_id: int, quantities, products):
+    expires_at = datetime.now() + timedelta(minutes=RESERVATION_TTL_MINUTES)
+    plain = {}
+    reservations = []
+    for product_id, quantity in sorted(quantities.items()):
+        shards = products[product_id].stock_shards
+        if not shards:
+            plain[product_id] = quantity
+            reservations.append((product_id, None, quantity))
+            continue
+
+        claimed = claim_shard_stock(db, product_id, shards, quantity)
+        if not claimed:
+            return False
+        reservations += [(product_id, shard, taken) for shard, taken in claimed]
+
+    db.execute(
+        insert(StockReservation),
+        [
+            {
+                "product_id": product_id,
+                "order_id": order_id,
+                "shard": shard,
+                "quantity": quantity,
+                "expires_at": expires_at,
+            }
+            for product_id, shard, quantity in reservations
+        ],
+    )
+    return not plain or claim_stock(db, plain)
+
+
+def claim_stock(db: Session, quantities):
+    params = {}
+    values = []
+    for i, (product_id, quantity) in enumerate(sorted(quantities.items())):
+        params[f"id_{i}"] = product_id
+        params[f"quantity_{i}"] = quantity
+        values.append(f"(:id_{i}, :quantity_{i})")
+
+    claimed = db.execute(
+        text(
+            f"""
+            WITH claims(id, quantity) AS (VALUES {", ".join(values)}),
+            locked AS (
+                SELECT product.id FROM product JOIN claims ON claims.id = product.id
+                WHERE product.stock - product.reserved >= claims.quantity
+                  AND product.stock_shards = 0
+                ORDER BY product.id
+                FOR NO KEY UPDATE OF product
+            )
+            UPDATE product
+            SET reserved = product.reserved + claims.quantity, updated_at = now()
+            FROM claims
+            WHERE product.id = claims.id
+              AND product.id IN (SELECT id FROM locked)
+              AND product.stock - product.reserved >= claims.quantity
+            RETURNING product.id
+            """
+        ),
+        params,
+    ).all()
+    return len(claimed) == len(quantities)
+
+
+def has_reservations(db: Session, order_id: int):
+    return db.query(
+        db.query(StockReservation)
+        .filter(StockReservation.order_id == order_id)
+        .exists()
+    ).scalar()
+
+
+def reclaim_stock(db: Session, order_id: int):
+    quantities = dict(
+        db.query(OrderItem.product_id, func.sum(OrderItem.quantity))
+        .filter(OrderItem.order_id == order_id)
+        .group_by(OrderItem.product_id)
+        .all()
+    )
+    products = {
+        product.id: product
+        for product in db.query(Product).filter(Product.id.in_(quantities)).all()
+    }
+    if not quantities or len(products) != len(quantities):
+        return False
+
+    savepoint = db.begin_nested()
+    if reserve_stock(db, order_id, quantities, products):
+        savepoint.commit()
+        return True
+    savepoint.rollback()
+    return False
+
+
+def extend_reservations(db: Session, order_id: int, expires_at: datetime):
+    db.execute(
+        update(StockReservation)
+        .where(
+            StockReservation.order_id == order_id,
+            StockReservation.expires_at < expires_at,
+        )
+        .values(expires_at=expires_at)
+    )
+
+
+RELEASE_SQL = """
+    released_products AS (
+        UPDATE product
+        SET reserved = product.reserved - released.quantity, updated_at = now()
+        FROM (
+            SELECT product_id, SUM(quantity) AS quantity
+            FROM released WHERE shard IS NULL GROUP BY product_id
+        ) released
+        WHERE product.id = released.product_id
+    ),
+    released_shards AS (
+        UPDATE product_stock_shard
+        SET reserved = product_stock_shard.reserved - released.quantity,
+            updated_at = now()
+        FROM (
+            SELECT product_id, shard, SUM(quantity) AS quantity
+            FROM released WHERE shard IS NOT NULL GROUP BY product_id, shard
+        ) released
+        WHERE product_stock_shard.product_id = released.product_id
+          AND product_stock_shard.shard = released.shard
+    )
+"""
+
+
+def release_reservations(db: Session, order_ids):
+    db.execute(
+        text(
+            f"""
+            WITH released AS (
+                DELETE FROM stock_reservation WHERE order_id = ANY(:order_ids)
+                RETURNING product_id, shard, quantity
+            ),
+            {RELEASE_SQL}
+            SELECT count(*) FROM released
+            """
+        ),
+        {"order_ids": list(order_ids)},
+    )
+
+
+def commit_reservations(db: Session, order_id: int):
+    db.execute(
+        text(
+            """
+            WITH committed AS (
+                DELETE FROM stock_reservation
+                WHERE order_id = :order_id AND shard IS NULL
+                RETURNING product_id, quantity
+            ),
+            reserved AS (
+                SELECT product_id, SUM(quantity) AS quantity
+                FROM committed GROUP BY product_id
+            ),
+            ordered AS (
+                SELECT product_id, SUM(quantity) AS quantity
+                FROM order_item WHERE order_id = :order_id GROUP BY product_id
+            )
+            UPDATE product SET
+                stock = product.stock - ordered.quantity,
+                reserved = product.reserved - COALESCE(reserved.quantity, 0),
+                updated_at = now()
+            FROM ordered LEFT JOIN reserved ON reserved.product_id = ordered.product_id
+            WHERE product.id = ordered.product_id
+            """
+        ),
+        {"order_id": order_id},
+    )
+    db.execute(
+        text(
+            """
+            WITH committed AS (
+                DELETE FROM stock_reservation
+                WHERE order_id = :order_id AND shard IS NOT NULL
+                RETURNING product_id, shard, quantity
+            )
+            UPDATE product_stock_shard SET
+                allocated = product_stock_shard.allocated - committed.quantity,
+                reserved = product_stock_shard.reserved - committed.quantity,
+                updated_at = now()
+            FROM (
+                SELECT product_id, shard, SUM(quantity) AS quantity
+                FROM committed GROUP BY product_id, shard
+            ) committed
+            WHERE product_stock_shard.product_id = committed.product_id
+              AND product_stock_shard.shard = committed.shard
+            """
+        ),
+        {"order_id": order_id},
+    )
+
+
+def release_expired_reservations(db: Session, limit: int):
+    cancelled = db.execute(
+        text(
+            f"""
+            WITH claimed AS (
+                SELECT id FROM "order"
+                WHERE status = 'pending'
+                  AND id IN (
+                    SELECT order_id FROM stock_reservation WHERE expires_at <= now()
+                  )
+                ORDER BY id
+                LIMIT :limit
+                FOR NO KEY UPDATE SKIP LOCKED
+            ),
+            released AS (
+                DELETE FROM stock_reservation USING claimed
+                WHERE stock_reservation.order_id = claimed.id
+                RETURNING product_id, order_id, shard, quantity
+            ),
+            {RELEASE_SQL},
+            cancelled AS (
+                UPDATE "order" SET status = 'cancelled', updated_at = now()
+                FROM claimed
+                WHERE "order".id = claimed.id
+                RETURNING "order".id, "order".user_id, "order".contact_email
+            )
+            SELECT
+                cancelled.id,
+                COALESCE(shipment.shipping_email, cancelled.contact_email, users.email)
+                    AS email
+            FROM cancelled
+            LEFT JOIN shipment ON shipment.order_id = cancelled.id
+            LEFT JOIN users ON users.id = cancelled.user_id
+            ORDER BY cancelled.id
+            """
+        ),
+        {"limit": limit},
+    ).all()
+    db.commit()
+    return cancelled
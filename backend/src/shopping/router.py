@@ -1,6 +1,6 @@
-from fastapi import APIRouter, status, Depends, HTTPException, BackgroundTasks
+from fastapi import APIRouter, status, Depends, HTTPException, BackgroundTasks, Header, Response
 from sqlalchemy.orm import Session
-from src.dependencies import get_db
+from src.dependencies import get_db, get_read_db
 from src.users.models import User
 from typing import List, Optional
 from src.shopping.schemas import GuestOrder
@@ -10,112 +10,157 @@ import jwt
 import os
 from src.shopping.schemas import (
     CartItemCreate, CartItemOut, CartOut, OrderOut, 
-    Status, IncrementDecrement, Price, OrderStatus
+    Status, IncrementDecrement, Price, OrderStatus, CartBatch, CartBatchOut
 )
 from src.shopping.service import (
     get_cart_for_user, create_cart, delete_all_items_from_cart,
     decrease_quantity, delete_one_item_from_cart, change_order_status,
     create_order_from_cart, cancel_order, create_cart_item,
     total_price_of_cart, increase_quantity, get_order_by_id, get_users_orders,
+    apply_cart_operations,
 )
-from src.constants import user_required
+from src.shopping.guest_carts import get_guest_cart_id, create_guest_cart
+from src.constants import user_required, admin_required
+from src.shopping.constants import IDEMPOTENCY_KEY_MAX_LENGTH
 
 router = APIRouter(tags=["shopping"], prefix="/shopping")
 
+def cart_owner(current_user: Optional[User]):
+    return current_user.id if current_user else None
+
 @router.get("/cart", response_model=CartOut)
-def get_cart(db: Session = Depends(get_db), current_user: Optional[User] = Depends(get_optional_current_user)):
-    if not current_user:
-        return {"id": 0, "user_id": 0, "items": []}
-    
-    cart = get_cart_for_user(db, current_user.id)
+def get_cart(db: Session = Depends(get_db), current_user: Optional[User] = Depends(get_optional_current_user), guest_cart_id: Optional[int] = Depends(get_guest_cart_id)):
+    cart = get_cart_for_user(db, cart_owner(current_user), guest_cart_id)
     if not cart:
-        return {"id": 0, "user_id": current_user.id, "items": []}
+        return {"id": 0, "user_id": cart_owner(current_user) or 0, "items": []}
     return cart
 
 @router.post("/cart", response_model=CartOut)
-def post_cart(db: Session = Depends(get_db), current_user: Optional[User] = Depends(get_optional_current_user)):
+def post_cart(response: Response, db: Session = Depends(get_db), current_user: Optional[User] = Depends(get_optional_current_user), guest_cart_id: Optional[int] = Depends(get_guest_cart_id)):
     if not current_user:
-        return {"id": 0, "user_id": 0, "items": []}
+        cart = get_cart_for_user(db, None, guest_cart_id)
+        if cart:
+            return cart
+        new_cart = create_guest_cart(db, response)
+        return {"id": new_cart.id, "user_id": 0, "items": []}
     
     new_cart = create_cart(db, current_user.id)
     return new_cart
 
+@router.patch("/cart", response_model=CartBatchOut)
+def patch_cart(request: CartBatch, response: Response, db: Session = Depends(get_db), current_user: Optional[User] = Depends(get_optional_current_user), guest_cart_id: Optional[int] = Depends(get_guest_cart_id)):
+    if not current_user and not guest_cart_id:
+        guest_cart_id = create_guest_cart(db, response).id
+
+    cart = apply_cart_operations(db, request.operations, cart_owner(current_user), guest_cart_id)
+    if not cart:
+        raise HTTPException(status_code=404, detail="Cart not found")
+    return cart
+
 @router.delete("/cart", response_model=Status)
-def delete_everything_from_cart(db: Session = Depends(get_db), current_user: Optional[User] = Depends(get_optional_current_user)):
-    if not current_user:
+def delete_everything_from_cart(db: Session = Depends(get_db), current_user: Optional[User] = Depends(get_optional_current_user), guest_cart_id: Optional[int] = Depends(get_guest_cart_id)):
+    if not current_user and not guest_cart_id:
         return {"status": "cleared_local"}
     
-    delete_all_items_from_cart(db, current_user.id)
+    delete_all_items_from_cart(db, cart_owner(current_user), guest_cart_id)
     return {"status": "deleted"}
 
 @router.delete("/cart/{product_id}", response_model=Status)
-def delete_single_item_from_cart(product_id: int, db: Session = Depends(get_db), current_user: Optional[User] = Depends(get_optional_current_user)):
-    if not current_user:
+def delete_single_item_from_cart(product_id: int, db: Session = Depends(get_db), current_user: Optional[User] = Depends(get_optional_current_user), guest_cart_id: Optional[int] = Depends(get_guest_cart_id)):
+    if not current_user and not guest_cart_id:
         return {"status": "deleted_local"}
     
-    delete_one_item_from_cart(db, product_id, current_user.id)
+    delete_one_item_from_cart(db, product_id, cart_owner(current_user), guest_cart_id)
     return {"status": "deleted"}
 
+def check_cart_item(cart_item):
+    if not cart_item:
+        raise HTTPException(status_code=404, detail="Cart item not found")
+    return cart_item
+
 @router.post("/cart/increase-quantity/{product_id}", response_model=CartItemOut)
-def increment_quantity(request: IncrementDecrement, db: Session = Depends(get_db), current_user: Optional[User] = Depends(get_optional_current_user)):
-    if not current_user:
-        raise HTTPException(status_code=202, detail="Guest: handle in local storage")
-    
+def increment_quantity(request: IncrementDecrement, db: Session = Depends(get_db), current_user: Optional[User] = Depends(get_optional_current_user), guest_cart_id: Optional[int] = Depends(get_guest_cart_id)):
     data = request.model_dump()
     product_id = data["product_id"]
-    return increase_quantity(db, product_id, current_user.id)
+    return check_cart_item(
+        increase_quantity(db, product_id, cart_owner(current_user), guest_cart_id)
+    )
 
 @router.post("/cart/decrease-quantity/{product_id}", response_model=CartItemOut | Status)
-def decrement_quantity(request: IncrementDecrement, db: Session = Depends(get_db), current_user: Optional[User] = Depends(get_optional_current_user)):
-    if not current_user:
-        raise HTTPException(status_code=202, detail="Guest: handle in local storage")
-    
+def decrement_quantity(request: IncrementDecrement, db: Session = Depends(get_db), current_user: Optional[User] = Depends(get_optional_current_user), guest_cart_id: Optional[int] = Depends(get_guest_cart_id)):
     data = request.model_dump()
     product_id = data["product_id"]
-    return decrease_quantity(db, product_id, current_user.id)
+    return check_cart_item(
+        decrease_quantity(db, product_id, cart_owner(current_user), guest_cart_id)
+    )
 
 @router.post("/cart/cartItem", response_model=CartItemOut)
-def post_cart_item(request: CartItemCreate, db: Session = Depends(get_db), current_user: Optional[User] = Depends(get_optional_current_user)):
-    if not current_user:
-        raise HTTPException(status_code=202, detail="Guest: handle in local storage")
-    
-    return create_cart_item(db, request, user_id=current_user.id)
+def post_cart_item(request: CartItemCreate, db: Session = Depends(get_db), current_user: Optional[User] = Depends(get_optional_current_user), guest_cart_id: Optional[int] = Depends(get_guest_cart_id)):
+    return check_cart_item(
+        create_cart_item(db, request, cart_owner(current_user), guest_cart_id)
+    )
 
 @router.get("/cart/price", response_model=Price)
-def get_cart_price(db: Session = Depends(get_db), current_user: Optional[User] = Depends(get_optional_current_user)):
-    if not current_user:
+def get_cart_price(db: Session = Depends(get_db), current_user: Optional[User] = Depends(get_optional_current_user), guest_cart_id: Optional[int] = Depends(get_guest_cart_id)):
+    if not current_user and not guest_cart_id:
         return {"total_price": 0.0}
-    return total_price_of_cart(db, current_user.id)
+    return total_price_of_cart(db, cart_owner(current_user), guest_cart_id)
 
-@router.post("/order", response_model=OrderOut)
-def post_order_from_cart(background_tasks: BackgroundTasks, db: Session = Depends(get_db), current_user: User = Depends(user_required)):
-    new_order = create_order_from_cart(db, current_user.id, background_tasks=background_tasks)
+def check_placed_order(new_order):
     if not new_order:
         raise HTTPException(status_code=404, detail="Error while placing order")
+    if isinstance(new_order, dict) and new_order["error"] == "idempotency_key_reused":
+        raise HTTPException(
+            status_code=422,
+            detail="Idempotency-Key was already used for a different request",
+        )
     return new_order
 
+@router.post("/order", response_model=OrderOut)
+def post_order_from_cart(
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(user_required),
+    idempotency_key: Optional[str] = Header(default=None, max_length=IDEMPOTENCY_KEY_MAX_LENGTH),
+):
+    new_order = create_order_from_cart(
+        db, current_user.id, background_tasks=background_tasks, idempotency_key=idempotency_key
+    )
+    return check_placed_order(new_order)
+
 @router.post("/guest-order", response_model=OrderOut)
-def post_guest_order(data: GuestOrder,background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
-    new_order = create_guest_order(db, data, background_tasks)
-    if not new_order:
-        raise HTTPException(status_code=404, detail="Error while placing order")
-    return new_order
+def post_guest_order(
+    data: GuestOrder,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db),
+    guest_cart_id: Optional[int] = Depends(get_guest_cart_id),
+    idempotency_key: Optional[str] = Header(default=None, max_length=IDEMPOTENCY_KEY_MAX_LENGTH),
+):
+    new_order = create_guest_order(
+        db, data, background_tasks, idempotency_key, guest_cart_id=guest_cart_id
+    )
+    return check_placed_order(new_order)
 
 @router.get("/orders", response_model=List[OrderOut])
-def get_all_orders(db: Session = Depends(get_db), current_user: User = Depends(user_required)):
+def get_all_orders(db: Session = Depends(get_read_db), current_user: User = Depends(user_required)):
     return get_users_orders(db, current_user.id)
 
 @router.get("/order/{order_id}", response_model=OrderOut)
-def get_specific_order(order_id: int, db: Session = Depends(get_db), current_user: User = Depends(user_required)):
+def get_specific_order(order_id: int, db: Session = Depends(get_read_db), current_user: User = Depends(user_required)):
     order = get_order_by_id(db, order_id, current_user.id)
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
     return order
 
 @router.put("/order/{order_id}/status", response_model=OrderOut)
-def change_status(order_id: int, request: OrderStatus, db: Session = Depends(get_db), current_user: User = Depends(user_required)):
+def change_status(order_id: int, request: OrderStatus, db: Session = Depends(get_db), current_user: User = Depends(admin_required)):
     status_val = request.model_dump()["status"]
-    return change_order_status(db, status_val, order_id, current_user.id)
+    order = change_order_status(db, status_val, order_id, current_user.id)
+    if not order:
+        raise HTTPException(status_code=404, detail="Order not found")
+    if isinstance(order, dict):
+        raise HTTPException(status_code=409, detail="Not enough stock to fulfil the order")
+    return order
 
 @router.put("/order/{order_id}/cancel", response_model=OrderOut)
 def deactivate_order(order_id: int, db: Session = Depends(get_db), current_user: User = Depends(user_required)):
@@ -5,7 +5,7 @@ from decimal import Decimal
 from typing import List
 from src.products.schemas import ProductOut
 from src.logistics.schemas import ShipmentCreate
-from src.shopping.constants import OrderStatus
+from src.shopping.constants import OrderStatus, CartOperationType, MAX_CART_OPERATIONS
 from enum import Enum
 
 
@@ -30,7 +30,7 @@ class CartItemCreate(CartItemBase):
 
 
 class CartItemOut(CartItemBase):
-    id: int
+    id: Optional[int] = None
     price_at_time: Decimal
     product: ProductOut
 
@@ -44,6 +44,27 @@ class Price(BaseModel):
     total_price: Decimal
 
 
+class CartOperation(BaseModel):
+    op: CartOperationType
+    product_id: int
+    quantity: int = Field(default=1, ge=0)
+
+
+class CartBatch(BaseModel):
+    operations: List[CartOperation] = Field(min_length=1, max_length=MAX_CART_OPERATIONS)
+
+
+class CartRejectedOperation(BaseModel):
+    index: int
+    product_id: int
+    reason: str
+
+
+class CartBatchOut(CartOut):
+    total_price: Decimal
+    rejected: List[CartRejectedOperation]
+
+
 class OrderBase(BaseModel):
     user_id: Optional[int] = None
 
@@ -85,10 +106,10 @@ class OrderStatus(BaseModel):
 
 class GuestOrderItem(BaseModel):
     product_id: int
-    quantity: int
+    quantity: int = Field(gt=0)
 
 
 class GuestOrder(BaseModel):
     email: EmailStr
-    items: List[GuestOrderItem]
+    items: List[GuestOrderItem] = []
     shipping_data: ShipmentCreate
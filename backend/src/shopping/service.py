@@ -1,27 +1,155 @@
 from fastapi import BackgroundTasks
-from sqlalchemy.orm import Session, joinedload
-from datetime import datetime, timedelta
+from sqlalchemy import insert, delete
+from sqlalchemy.orm import Session, joinedload, selectinload
 from src.users.models import User
 from src.shopping.models import Cart, CartItem, Order, OrderItem
 from src.products.models import Product
+from src.products.pricing import get_prices, apply_prices
 from src.shopping.schemas import CartCreate, CartItemCreate
-from src.shopping.constants import OrderStatus
+from src.shopping.constants import (
+    OrderStatus,
+    IdempotencyScope,
+    CartOperationType,
+    ORDER_SWEEP_BATCH_SIZE,
+)
 from src.users.constants import Role
 from src.shopping.schemas import GuestOrder
 from src.logistics.models import Shipment
-from src.email.service import send_order_confirmation, send_order_cancelled_email
-
-
-
-def get_cart_for_user(db: Session, user_id: int):
+from src.email.service import (
+    send_order_confirmation,
+    send_order_cancelled_email,
+    queue_email,
+)
+from src.shopping.reservations import (
+    reserve_stock,
+    release_reservations,
+    release_expired_reservations,
+    commit_reservations,
+    has_reservations,
+    reclaim_stock,
+)
+from src.products.popularity import record_sales_popularity
+from src.shopping.idempotency import (
+    fingerprint,
+    claim_idempotency_key,
+    complete_idempotency_key,
+)
+from src.shopping.cart_store import cart_store, cart_key, cart_state, write_carts
+from typing import Optional
+from datetime import datetime
+from decimal import Decimal
+
+
+
+def cart_filters(user_id: Optional[int], guest_cart_id: Optional[int] = None):
+    if user_id is not None:
+        return [Cart.user_id == user_id]
+    return [
+        Cart.id == guest_cart_id,
+        Cart.user_id.is_(None),
+        Cart.expires_at > datetime.now(),
+    ]
+
+
+def query_cart(db: Session, user_id: Optional[int], guest_cart_id: Optional[int] = None):
+    if user_id is None and guest_cart_id is None:
+        return None
     return (
         db.query(Cart)
-        .options(joinedload(Cart.items).joinedload(CartItem.product))
-        .filter(Cart.user_id == user_id)
+        .options(joinedload(Cart.items))
+        .filter(*cart_filters(user_id, guest_cart_id))
         .first()
     )
 
 
+def load_cart(db: Session, user_id: Optional[int], guest_cart_id: Optional[int] = None):
+    if user_id is None and guest_cart_id is None:
+        return None
+
+    key = cart_key(user_id, guest_cart_id)
+    if cart_store:
+        cart = cart_store.get(key)
+        if cart is not None:
+            return cart
+
+    db_cart = query_cart(db, user_id, guest_cart_id)
+    if not db_cart:
+        return None
+
+    cart = cart_state(db_cart)
+    if cart_store:
+        cart_store.set(key, cart, dirty=False)
+    return cart
+
+
+def save_cart(db: Session, user_id: Optional[int], cart, guest_cart_id: Optional[int] = None):
+    if cart_store:
+        cart_store.set(cart_key(user_id, guest_cart_id), cart)
+        return cart
+
+    written = write_carts(db, [cart])
+    db.commit()
+    for item in cart["items"]:
+        item["id"] = written.get((cart["id"], item["product_id"]), item["id"])
+    return cart
+
+
+def find_cart_item(cart, product_id: int):
+    for item in cart["items"]:
+        if item["product_id"] == product_id:
+            return item
+    return None
+
+
+def get_cart_products(db: Session, product_ids):
+    products = {
+        product.id: product
+        for product in db.query(Product)
+        .options(selectinload(Product.images))
+        .filter(Product.id.in_(product_ids))
+        .all()
+    }
+    apply_prices(db, products.values())
+    return products
+
+
+def cart_item_out(cart, item, product):
+    return {
+        "id": item["id"],
+        "cart_id": cart["id"],
+        "product_id": item["product_id"],
+        "quantity": item["quantity"],
+        "price_at_time": Decimal(item["price_at_time"]),
+        "product": product,
+    }
+
+
+def cart_out(db: Session, user_id: Optional[int], cart):
+    products = get_cart_products(db, [item["product_id"] for item in cart["items"]])
+    return {
+        "id": cart["id"],
+        "user_id": user_id or 0,
+        "items": [
+            cart_item_out(cart, item, products[item["product_id"]])
+            for item in cart["items"]
+            if item["product_id"] in products
+        ],
+    }
+
+
+def cart_total(cart):
+    return sum(
+        Decimal(item["price_at_time"]) * item["quantity"] for item in cart["items"]
+    )
+
+
+def get_cart_for_user(db: Session, user_id: Optional[int], guest_cart_id: Optional[int] = None):
+    cart = load_cart(db, user_id, guest_cart_id)
+    if not cart:
+        return None
+    return cart_out(db, user_id, cart)
+
+
 def create_cart(db: Session, user_id: int):
     existing_cart = db.query(Cart).filter(Cart.user_id == user_id).first()
     if existing_cart:
@@ -33,123 +161,294 @@ def create_cart(db: Session, user_id: int):
     db.commit()
     db.refresh(created_cart)
 
+    if cart_store:
+        cart_store.set(cart_key(user_id), {"id": created_cart.id, "items": []}, dirty=False)
     return created_cart
 
 
-def delete_all_items_from_cart(db: Session, user_id: int):
-    db_cart = get_cart_for_user(db, user_id)
+def delete_all_items_from_cart(db: Session, user_id: Optional[int], guest_cart_id: Optional[int] = None):
+    cart = load_cart(db, user_id, guest_cart_id)
 
-    if not db_cart:
+    if not cart:
         return None
 
-    db_cart.items.clear()
-    db.commit()
-    db.refresh(db_cart)
-
-    return db_cart
+    cart["items"] = []
+    return save_cart(db, user_id, cart, guest_cart_id)
 
 
-def delete_one_item_from_cart(db: Session, product_id: int, user_id: int):
-    cart_item = (
-        db.query(CartItem)
-        .join(Cart)
-        .filter(Cart.user_id == user_id, CartItem.product_id == product_id)
-        .options(joinedload(CartItem.product))
-        .first()
-    )
+def delete_one_item_from_cart(
+    db: Session, product_id: int, user_id: Optional[int], guest_cart_id: Optional[int] = None
+):
+    cart = load_cart(db, user_id, guest_cart_id)
+    cart_item = find_cart_item(cart, product_id) if cart else None
     if not cart_item:
         return None
-    db.delete(cart_item)
-    db.commit()
+
+    cart["items"].remove(cart_item)
+    save_cart(db, user_id, cart, guest_cart_id)
 
     return cart_item
 
 
-def increase_quantity(db: Session, product_id: int, user_id: int):
-    cart_item = (
-        db.query(CartItem)
-        .join(Cart)
-        .filter(Cart.user_id == user_id, CartItem.product_id == product_id)
-        .options(joinedload(CartItem.product))
-        .first()
-    )
+def increase_quantity(
+    db: Session, product_id: int, user_id: Optional[int], guest_cart_id: Optional[int] = None
+):
+    cart = load_cart(db, user_id, guest_cart_id)
+    cart_item = find_cart_item(cart, product_id) if cart else None
     if not cart_item:
         return None
-    if cart_item.quantity < cart_item.product.stock:
-        cart_item.quantity += 1
+
+    product = get_cart_products(db, [product_id]).get(product_id)
+    if product and cart_item["quantity"] < product.available:
+        cart_item["quantity"] += 1
     else:
         return None
 
-    db.commit()
-    db.refresh(cart_item)
-    return cart_item
+    save_cart(db, user_id, cart, guest_cart_id)
+    return cart_item_out(cart, cart_item, product)
 
 
-def decrease_quantity(db: Session, product_id: int, user_id: int):
-    cart_item = (
-        db.query(CartItem)
-        .join(Cart)
-        .filter(Cart.user_id == user_id, CartItem.product_id == product_id)
-        .options(joinedload(CartItem.product))
-        .first()
-    )
+def decrease_quantity(
+    db: Session, product_id: int, user_id: Optional[int], guest_cart_id: Optional[int] = None
+):
+    cart = load_cart(db, user_id, guest_cart_id)
+    cart_item = find_cart_item(cart, product_id) if cart else None
     if not cart_item:
         return None
 
-    if cart_item.quantity > 1:
-        cart_item.quantity -= 1
+    if cart_item["quantity"] > 1:
+        cart_item["quantity"] -= 1
     else:
-        delete_one_item_from_cart(db, product_id, user_id)
+        cart["items"].remove(cart_item)
+        save_cart(db, user_id, cart, guest_cart_id)
         return {"status": "deleted"}
 
-    db.commit()
-    db.refresh(cart_item)
-    return cart_item
+    save_cart(db, user_id, cart, guest_cart_id)
+    product = get_cart_products(db, [product_id]).get(product_id)
+    return cart_item_out(cart, cart_item, product)
 
 
-def create_cart_item(db: Session, cart_item: CartItemCreate, user_id: int):
+def create_cart_item(
+    db: Session,
+    cart_item: CartItemCreate,
+    user_id: Optional[int],
+    guest_cart_id: Optional[int] = None,
+):
     data = cart_item.model_dump()
-    existing_cart = (
-        db.query(CartItem)
-        .filter(
-            CartItem.product_id == data["product_id"],
-            CartItem.cart_id == data["cart_id"],
-        )
-        .first()
-    )
+    cart = load_cart(db, user_id, guest_cart_id)
+    if not cart or cart["id"] != data["cart_id"]:
+        return None
+
     product_id = data["product_id"]
-    if existing_cart:
-        return increase_quantity(db, product_id, user_id)
+    if find_cart_item(cart, product_id):
+        return increase_quantity(db, product_id, user_id, guest_cart_id)
 
-    new_cart_item = CartItem(**data)
-    product = db.query(Product).filter(Product.id == new_cart_item.product_id).first()
-    if not product:
+    price = get_prices(db, [product_id]).get(product_id)
+    if not price:
         return None
 
-    price = product.current_price
-    new_cart_item.price_at_time = price
+    new_cart_item = {
+        "id": None,
+        "product_id": product_id,
+        "quantity": data["quantity"],
+        "price_at_time": str(price["current_price"]),
+    }
+    cart["items"].append(new_cart_item)
+    save_cart(db, user_id, cart, guest_cart_id)
 
-    db.add(new_cart_item)
-    db.commit()
-    db.refresh(new_cart_item)
+    product = get_cart_products(db, [product_id]).get(product_id)
+    return cart_item_out(cart, new_cart_item, product)
 
-    return new_cart_item
 
-
-def total_price_of_cart(db: Session, user_id: int):
-    cart = get_cart_for_user(db, user_id)
+def apply_cart_operations(
+    db: Session, operations, user_id: Optional[int], guest_cart_id: Optional[int] = None
+):
+    cart = load_cart(db, user_id, guest_cart_id)
+    if not cart:
+        if user_id is None:
+            return None
+        db_cart = Cart(user_id=user_id)
+        db.add(db_cart)
+        db.commit()
+        cart = {"id": db_cart.id, "items": []}
+
+    quantities = {item["product_id"]: item["quantity"] for item in cart["items"]}
+
+    product_ids = {operation.product_id for operation in operations}
+    products = {
+        product.id: product
+        for product in db.query(Product)
+        .filter(Product.id.in_(product_ids), Product.is_active == True)
+        .all()
+    }
+    prices = get_prices(db, products)
+
+    rejected = []
+    for index, operation in enumerate(operations):
+        product_id = operation.product_id
+        current = quantities.get(product_id, 0)
+        if operation.op == CartOperationType.remove:
+            quantities[product_id] = 0
+            continue
+        if product_id not in products or product_id not in prices:
+            rejected.append({"index": index, "product_id": product_id, "reason": "not_found"})
+            continue
+
+        if operation.op == CartOperationType.add:
+            quantity = current + operation.quantity
+        else:
+            quantity = operation.quantity
+        if quantity > current and quantity > products[product_id].available:
+            rejected.append(
+                {"index": index, "product_id": product_id, "reason": "insufficient_stock"}
+            )
+            continue
+        quantities[product_id] = quantity
+
+    items = {item["product_id"]: item for item in cart["items"]}
+    cart["items"] = []
+    for product_id, quantity in quantities.items():
+        if not quantity:
+            continue
+        item = items.get(product_id) or {
+            "id": None,
+            "product_id": product_id,
+            "price_at_time": str(prices[product_id]["current_price"]),
+        }
+        item["quantity"] = quantity
+        cart["items"].append(item)
+    save_cart(db, user_id, cart, guest_cart_id)
+
+    return {
+        **cart_out(db, user_id, cart),
+        "total_price": cart_total(cart),
+        "rejected": rejected,
+    }
+
+
+def total_price_of_cart(db: Session, user_id: Optional[int], guest_cart_id: Optional[int] = None):
+    cart = load_cart(db, user_id, guest_cart_id)
     if not cart:
         return 0
-    summed = sum(item.price_at_time * item.quantity for item in cart.items)
-    return {"total_price": summed}
+    return {"total_price": cart_total(cart)}
 
 
-def create_order_from_cart(db: Session, user_id: int, background_tasks: BackgroundTasks):
-    cart = get_cart_for_user(db, user_id)
+def get_products(db: Session, quantities):
+    products = db.query(Product).filter(Product.id.in_(quantities)).all()
+    if len(products) != len(quantities):
+        return None
+    return {product.id: product for product in products}
+
+
+def add_order_items(db: Session, order_id: int, quantities, products, prices):
+    db.execute(
+        insert(OrderItem),
+        [
+            {
+                "order_id": order_id,
+                "product_id": product_id,
+                "product_name_snapshot": products[product_id].name,
+                "price": prices[product_id]["current_price"],
+                "quantity": quantity,
+            }
+            for product_id, quantity in quantities.items()
+        ],
+    )
+
+
+def sum_quantities(items):
+    quantities = {}
+    for item in items:
+        quantities[item.product_id] = quantities.get(item.product_id, 0) + item.quantity
+    return quantities
+
+
+def checkout_cart(db: Session, user_id: Optional[int], guest_cart_id: Optional[int] = None):
+    cart_id = (
+        db.query(Cart.id)
+        .filter(*cart_filters(user_id, guest_cart_id))
+        .with_for_update()
+        .scalar()
+    )
+    if not cart_id:
+        return None, None
+
+    cached_cart = None
+    if cart_store:
+        cached_cart = cart_store.get(cart_key(user_id, guest_cart_id))
+        if cached_cart is not None:
+            write_carts(db, [cached_cart])
+    cart = (
+        db.query(Cart)
+        .options(joinedload(Cart.items))
+        .populate_existing()
+        .filter(Cart.id == cart_id)
+        .first()
+    )
+    return cart, cached_cart
+
+
+def commit_checkout(db: Session, key: str, cart_id: int, cached_cart):
+    if cart_store:
+        cart_store.set(key, {"id": cart_id, "items": []}, dirty=False)
+    try:
+        db.commit()
+    except Exception:
+        if cart_store and cached_cart is not None:
+            cart_store.set(key, cached_cart)
+        elif cart_store:
+            cart_store.delete(key)
+        raise
+
+
+def replay_order(db: Session, stored):
+    if isinstance(stored, dict):
+        return stored
+
+    order = (
+        db.query(Order)
+        .options(joinedload(Order.items).joinedload(OrderItem.product))
+        .filter(Order.id == stored.order_id)
+        .first()
+    )
+    if order:
+        apply_prices(db, [item.product for item in order.items])
+    return order
+
+
+def create_order_from_cart(
+    db: Session,
+    user_id: int,
+    background_tasks: BackgroundTasks,
+    idempotency_key: Optional[str] = None,
+):
+    key_id = None
+    if idempotency_key:
+        key_id, stored = claim_idempotency_key(
+            db,
+            IdempotencyScope.order,
+            f"user:{user_id}",
+            idempotency_key,
+            fingerprint(f"user:{user_id}"),
+        )
+        if stored:
+            return replay_order(db, stored)
+
+    cart, cached_cart = checkout_cart(db, user_id)
     if not cart or not cart.items:
+        db.rollback()
         return None
 
-    total_amount = sum(item.product.price * item.quantity for item in cart.items)
+    quantities = sum_quantities(cart.items)
+    products = get_products(db, quantities)
+    prices = get_prices(db, quantities)
+    if not products or len(prices) != len(quantities):
+        db.rollback()
+        return None
+    total_amount = sum(
+        prices[product_id]["current_price"] * quantity
+        for product_id, quantity in quantities.items()
+    )
 
     new_order = Order(
         user_id=user_id,
@@ -160,31 +459,19 @@ def create_order_from_cart(db: Session, user_id: int, background_tasks: Backgrou
 
     db.add(new_order)
     db.flush()
+    if key_id:
+        complete_idempotency_key(db, key_id, new_order.id)
 
-    for cart_item in cart.items:
-        product = (db.query(Product).with_for_update().
-        filter(Product.id == cart_item.product_id).first()
-        )
-        if not product or product.stock < cart_item.quantity:
-            db.rollback()
-            return None
-        order_item = OrderItem(
-            order_id=new_order.id,
-            product_id=cart_item.product.id,
-            product_name_snapshot=cart_item.product.name,
-            price=cart_item.product.price,
-            quantity=cart_item.quantity,
-        )
-        db.add(order_item)
+    add_order_items(db, new_order.id, quantities, products, prices)
+    db.execute(delete(CartItem).where(CartItem.cart_id == cart.id))
 
-        product.stock -= cart_item.quantity
-        
-    cart.items.clear()
-    recipient_email = new_order.user.email
-    background_tasks.add_task(send_order_confirmation, new_order, email = new_order.user.email)
+    if not reserve_stock(db, new_order.id, quantities, products):
+        db.rollback()
+        return None
 
-    db.commit()
+    commit_checkout(db, cart_key(user_id), cart.id, cached_cart)
     db.refresh(new_order)
+    background_tasks.add_task(send_order_confirmation, new_order, email = new_order.user.email)
     return new_order
 
 
@@ -198,12 +485,15 @@ def get_users_orders(db: Session, user_id: int):
 
 
 def get_order_by_id(db: Session, order_id: int, user_id: int):
-    return (
+    order = (
         db.query(Order)
         .options(joinedload(Order.items).joinedload(OrderItem.product))
         .filter(Order.id == order_id, Order.user_id == user_id)
         .first()
     )
+    if order:
+        apply_prices(db, [item.product for item in order.items])
+    return order
 
 
 def cancel_order(db: Session, order_id: int, user_id: int):
@@ -225,90 +515,98 @@ def cancel_order(db: Session, order_id: int, user_id: int):
     if not (is_owner or is_admin) or db_order.status != OrderStatus.pending:
         return None
 
-    for item in db_order.items:
-        if item.product:
-            item.product.stock += item.quantity
-
+    release_reservations(db, [db_order.id])
     db_order.status = OrderStatus.cancelled
     db.commit()
     db.refresh(db_order)
     return db_order
 
-def cancel_pending_orders(db: Session, time: int):
-    expired_limit = datetime.now() - timedelta(seconds=time)
-    db_orders = (
-        db.query(Order)
-        .options(
-            joinedload(Order.items).joinedload(OrderItem.product),
-            joinedload(Order.shipment),
-            joinedload(Order.user)
-        )
-        .filter(Order.status == OrderStatus.pending,
-                Order.created_at < expired_limit)
-        .all()
-    )
-    if not db_orders:
+def cancel_expired_orders(db: Session):
+    order_ids = []
+    while True:
+        cancelled = release_expired_reservations(db, ORDER_SWEEP_BATCH_SIZE)
+        for order_id, email in cancelled:
+            order_ids.append(order_id)
+            if email:
+                queue_email(send_order_cancelled_email, order_id, email)
+        if len(cancelled) < ORDER_SWEEP_BATCH_SIZE:
+            break
+
+    if not order_ids:
         return None
+    return {"status": "cancelled", "orders": order_ids}
+
 
-    for order in db_orders:
-        email = None
-        if order.shipment:
-            email = order.shipment.shipping_email
-        elif order.contact_email:
-            email = order.contact_email
-        elif order.user:
-            email = order.user.email
-
-        if email:
-            try:
-                send_order_cancelled_email(order.id, email)
-            except Exception:
-                pass
-
-        for item in order.items:
-            if item.product:
-                item.product.stock += item.quantity
-
-        order.status = OrderStatus.cancelled
-        
-    db.commit()
-    return {"status":"cancelled"}
 def change_order_status(
     db: Session, new_status: OrderStatus, order_id: int, user_id: int
 ):
     if new_status == OrderStatus.cancelled:
         return cancel_order(db, order_id, user_id)
-    db_order = db.query(Order).filter(Order.id == order_id).first()
+    db_order = db.query(Order).filter(Order.id == order_id).with_for_update().first()
     if not db_order:
         return None
 
+    settles = new_status in (OrderStatus.paid, OrderStatus.shipped) and (
+        db_order.status in (OrderStatus.pending, OrderStatus.cancelled)
+    )
+    if settles:
+        reserved = db_order.status == OrderStatus.pending and has_reservations(
+            db, db_order.id
+        )
+        if not reserved and not reclaim_stock(db, db_order.id):
+            db.rollback()
+            return {"error": "insufficient_stock"}
+        commit_reservations(db, db_order.id)
+        record_sales_popularity(db, db_order.id)
+
     db_order.status = new_status
     db.commit()
     db.refresh(db_order)
     return db_order
 
 
-def create_guest_order(db: Session, data: GuestOrder, background_tasks: BackgroundTasks):
-    if not data.items:
+def create_guest_order(
+    db: Session,
+    data: GuestOrder,
+    background_tasks: BackgroundTasks,
+    idempotency_key: Optional[str] = None,
+    guest_cart_id: Optional[int] = None,
+):
+    from_cart = not data.items and guest_cart_id is not None
+    if not data.items and not from_cart:
         return None
 
-    total_price = 0
-    list_items = []
-    for item in data.items:
-        product = db.query(Product).with_for_update().filter(Product.id == item.product_id).first()
-        if not (product and item.quantity <= product.stock):
-            db.rollback()
-            return None
-        
-        order_item = OrderItem(
-            product_id=product.id,
-            product_name_snapshot=product.name,
-            price=product.current_price,
-            quantity=item.quantity,
+    key_id = None
+    if idempotency_key:
+        payload = data.model_dump_json()
+        if from_cart:
+            payload = f"cart:{guest_cart_id}:{payload}"
+        key_id, stored = claim_idempotency_key(
+            db,
+            IdempotencyScope.guest_order,
+            f"guest:{data.email.lower()}",
+            idempotency_key,
+            fingerprint(payload),
         )
-        list_items.append(order_item)
-        total_price += product.current_price * item.quantity
-        product.stock -= item.quantity
+        if stored:
+            return replay_order(db, stored)
+
+    cart, cached_cart = checkout_cart(db, None, guest_cart_id) if from_cart else (None, None)
+    if from_cart and (not cart or not cart.items):
+        db.rollback()
+        return None
+
+    quantities = sum_quantities(cart.items if cart else data.items)
+    products = get_products(db, quantities)
+    if not products:
+        db.rollback()
+        return None
+
+    prices = get_prices(db, quantities)
+    total_price = sum(
+        prices[product_id]["current_price"] * quantity
+        for product_id, quantity in quantities.items()
+    )
 
     new_order = Order(
         contact_email=data.email,
@@ -319,10 +617,12 @@ def create_guest_order(db: Session, data: GuestOrder, background_tasks: Backgrou
 
     db.add(new_order)
     db.flush()
+    if key_id:
+        complete_idempotency_key(db, key_id, new_order.id)
 
-    for order_item in list_items:
-        order_item.order_id = new_order.id
-        db.add(order_item)
+    add_order_items(db, new_order.id, quantities, products, prices)
+    if cart:
+        db.execute(delete(CartItem).where(CartItem.cart_id == cart.id))
 
     shipment_dict = data.shipping_data.model_dump()
     shipment_dict["order_id"] = new_order.id
@@ -331,8 +631,16 @@ def create_guest_order(db: Session, data: GuestOrder, background_tasks: Backgrou
     
     new_shipment = Shipment(**shipment_dict)
     db.add(new_shipment)
+    db.flush()
 
-    background_tasks.add_task(send_order_confirmation, new_order, data.email)
-    db.commit()
+    if not reserve_stock(db, new_order.id, quantities, products):
+        db.rollback()
+        return None
+
+    if cart:
+        commit_checkout(db, cart_key(None, cart.id), cart.id, cached_cart)
+    else:
+        db.commit()
     db.refresh(new_order)
+    background_tasks.add_task(send_order_confirmation, new_order, data.email)
     return new_order
\ No newline at end of file
@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, Response
 from sqlalchemy.orm import Session
 from src.users.schemas import (
     RegisterResponse,
@@ -27,14 +27,30 @@ from src.auth.token import create_access_token, get_current_user
 from src.users.models import User
 from fastapi.security import OAuth2PasswordRequestForm
 from datetime import timedelta
+from src.shopping.guest_carts import get_guest_cart_id, merge_guest_cart
+from src.shopping.constants import GUEST_CART_COOKIE
+from typing import Optional
 from src.constants import allow_any, user_required, admin_required, superadmin_required
 
 
 router = APIRouter(prefix="/user", tags=["users"])
 
 
+def adopt_guest_cart(
+    db: Session, response: Response, guest_cart_id: Optional[int], user_id: int
+):
+    if guest_cart_id:
+        merge_guest_cart(db, guest_cart_id, user_id)
+        response.delete_cookie(GUEST_CART_COOKIE)
+
+
 @router.post("/register", response_model=RegisterResponse)
-def register(request: RegisterRequest, db: Session = Depends(get_db)):
+def register(
+    request: RegisterRequest,
+    response: Response,
+    db: Session = Depends(get_db),
+    guest_cart_id: Optional[int] = Depends(get_guest_cart_id),
+):
     if get_user(db, request.email):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -47,6 +63,7 @@ def register(request: RegisterRequest, db: Session = Depends(get_db)):
     db.add(user)
     db.commit()
     db.refresh(user)
+    adopt_guest_cart(db, response, guest_cart_id, user.id)
 
     token_data = {"sub": str(user.id), "role": user.role.value}
 
@@ -57,7 +74,10 @@ def register(request: RegisterRequest, db: Session = Depends(get_db)):
 
 @router.post("/login", response_model=LoginResponse)
 def login(
-    request: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)
+    response: Response,
+    request: OAuth2PasswordRequestForm = Depends(),
+    db: Session = Depends(get_db),
+    guest_cart_id: Optional[int] = Depends(get_guest_cart_id),
 ):
     if not db.query(User).filter(User.email == request.username).first():
         raise HTTPException(
@@ -71,6 +91,7 @@ def login(
         )
 
     user = db.query(User).filter(User.email == request.username).first()
+    adopt_guest_cart(db, response, guest_cart_id, user.id)
 
     token_data = {"sub": str(user.id), "role": user.role.value}
 